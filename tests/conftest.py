@@ -0,0 +1,16 @@
+import pytest
+from traffic_sim.utils import FRUSTRATION_MAP, RateProfile
+
+
+@pytest.fixture
+def lanes_config() -> list[dict]:
+    return [
+        {'traffic_rate_fn': RateProfile(morning_peak_rate=10, evening_peak_rate=20)},
+        {'traffic_rate_fn': RateProfile(morning_peak_rate=15, evening_peak_rate=15)},
+        {'traffic_rate_fn': RateProfile(morning_peak_rate=20, evening_peak_rate=10)},
+    ]
+
+
+@pytest.fixture
+def sim_kwargs(lanes_config) -> dict:
+    return {'lanes_config': lanes_config, 'exit_rate': 1, 'frustration_fn': FRUSTRATION_MAP['quad']}
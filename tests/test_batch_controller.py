@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from traffic_sim.entities.arrivals import SensorArrivals
+from traffic_sim.results import SimulationResult
+from traffic_sim.simulator import batch_sim, main, sim
+from traffic_sim.strategies import ConstantController, IdleController
+
+
+@pytest.mark.parametrize('controller, strategy_kwargs', [
+    (ConstantController, {'wait_time': 20}),
+    (IdleController, {'wait_time': 20, 'idle_time': 5}),
+])
+def test_batch_matches_pooled_replicates(sim_kwargs, controller, strategy_kwargs):
+    # 1.5 hours crosses the boundary of the hourly arrival chunks
+    batch = batch_sim(controller, 3, duration_hours=1.5, seed=7, **strategy_kwargs, **sim_kwargs)
+    batched = SimulationResult.from_batch(batch)
+    pooled = [
+        SimulationResult.from_controller(sim(controller, duration_hours=1.5, seed=seed, **strategy_kwargs, **sim_kwargs))
+        for seed in np.random.SeedSequence(7).spawn(3)
+    ]
+
+    assert [r.num_passed for r in batched] == [r.num_passed for r in pooled]
+    assert [r.total_frustration for r in batched] == pytest.approx([r.total_frustration for r in pooled])
+
+
+def test_vectorised_main_rejects_custom_arrivals(sim_kwargs):
+    sim_kwargs['lanes_config'][0]['arrivals'] = SensorArrivals()
+    with pytest.raises(NotImplementedError, match='arrivals'):
+        main(ConstantController, 2, vectorised=True, duration_hours=0.1, wait_time=20, **sim_kwargs)
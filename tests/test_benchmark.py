@@ -0,0 +1,13 @@
+from traffic_sim.benchmark import bench_snapshot_loop_start
+from traffic_sim.strategies import SnapshotController
+
+
+def test_snapshot_loop_start_solves_the_split_on_every_call(monkeypatch):
+    setup, run = bench_snapshot_loop_start(5)
+    c = setup()
+
+    n_solved = []
+    optimal_split = SnapshotController.optimal_split
+    monkeypatch.setattr(SnapshotController, 'optimal_split', lambda self: n_solved.append(1) or optimal_split(self))
+    run(c)
+    assert len(n_solved) == 5
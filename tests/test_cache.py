@@ -0,0 +1,45 @@
+from functools import partial
+
+import numpy as np
+import pytest
+from traffic_sim.cache import ResultCache, result_key
+from traffic_sim.simulator import sim_pool
+from traffic_sim.strategies import ConstantController
+from traffic_sim.utils import traffic_rate
+
+
+def _job(sim_kwargs, **rate_params) -> dict:
+    lanes_config = [{'traffic_rate_fn': partial(traffic_rate, **rate_params)}]
+    return {**sim_kwargs, 'lanes_config': lanes_config, 'controller': ConstantController, 'wait_time': 20,
+            'seed': np.random.SeedSequence(0)}
+
+
+def test_partial_rate_functions_key_on_their_arguments(sim_kwargs):
+    key = result_key(_job(sim_kwargs, morning_peak_rate=10, evening_peak_rate=20))
+    assert key == result_key(_job(sim_kwargs, evening_peak_rate=20, morning_peak_rate=10))
+    assert key != result_key(_job(sim_kwargs, morning_peak_rate=10, evening_peak_rate=25))
+
+
+class _Square:
+    __slots__ = ()
+
+    def __call__(self, x):
+        return x ** 2
+
+
+def test_unnamed_callable_is_rejected(sim_kwargs):
+    job = _job(sim_kwargs, morning_peak_rate=10, evening_peak_rate=20)
+    job['frustration_fn'] = _Square()
+    with pytest.raises(TypeError, match='cache key'):
+        result_key(job)
+
+
+def test_cached_result_round_trips(tmp_path, sim_kwargs):
+    job = {**_job(sim_kwargs, morning_peak_rate=10, evening_peak_rate=20), 'duration_hours': 0.5}
+    cache = ResultCache(tmp_path)
+    key = result_key(job)
+    assert cache.get(key) is None
+
+    result = sim_pool(job)
+    cache.put(key, result)
+    assert cache.get(key).total_frustration == result.total_frustration
@@ -0,0 +1,33 @@
+import pytest
+from traffic_sim.checkpoint import fork_state, save_checkpoint
+from traffic_sim.simulator import sim
+from traffic_sim.strategies import ConstantController, SnapshotController
+
+
+def test_snapshot_fork_estimates_match_cold_run(sim_kwargs):
+    base = sim(ConstantController, duration_hours=8, seed=3, wait_time=20, **sim_kwargs)
+    branch = SnapshotController(warm_start=fork_state(base), rate_lookback=300, **sim_kwargs)
+    cold = sim(SnapshotController, duration_hours=8, seed=3, rate_lookback=300, **sim_kwargs)
+
+    assert branch.clock.time == cold.clock.time
+    branch_rates = [branch.estimate_entry_rate(lane) for lane in branch.lanes]
+    cold_rates = [cold.estimate_entry_rate(lane) for lane in cold.lanes]
+    assert branch_rates == cold_rates
+    assert min(cold_rates) > 0
+
+
+@pytest.mark.parametrize('controller, strategy_kwargs', [
+    (ConstantController, {'wait_time': 20}),
+    (SnapshotController, {'rate_lookback': 300, 'loop_duration': 60}),
+])
+def test_restored_branch_reproduces_uninterrupted_run(tmp_path, sim_kwargs, controller, strategy_kwargs):
+    full = sim(controller, duration_hours=3, seed=5, **strategy_kwargs, **sim_kwargs)
+    head = sim(controller, duration_hours=2, seed=5, **strategy_kwargs, **sim_kwargs)
+
+    path = tmp_path / 'checkpoint.gz'
+    save_checkpoint(head, path)
+    tail = sim(controller, duration_hours=1, checkpoint=path, **strategy_kwargs, **sim_kwargs)
+
+    assert tail.clock.time == full.clock.time
+    assert tail.num_passed == full.num_passed
+    assert tail.total_frustration == pytest.approx(full.total_frustration)
@@ -0,0 +1,20 @@
+import pytest
+from traffic_sim.distributed import JobFailedError, distributed_main
+from traffic_sim.simulator import main
+from traffic_sim.strategies import ConstantController
+
+
+def test_distributed_matches_local_run(tmp_path, sim_kwargs):
+    local = main(ConstantController, 4, duration_hours=0.5, seed=11, wait_time=20, **sim_kwargs)
+    distributed = distributed_main(ConstantController, 4, tmp_path, replicates_per_job=3, seed=11, poll=0.05,
+                                   n_local_workers=2, duration_hours=0.5, wait_time=20, **sim_kwargs)
+
+    assert distributed['frustrations'] == local['frustrations']
+
+
+def test_failing_job_is_raised_and_cleared(tmp_path, sim_kwargs):
+    with pytest.raises(JobFailedError, match='TypeError'):
+        distributed_main(ConstantController, 2, tmp_path, seed=11, poll=0.05, n_local_workers=1,
+                         duration_hours=0.1, wait_tme=20, **sim_kwargs)
+
+    assert [path for folder in ('pending', 'claimed', 'results') for path in (tmp_path / folder).iterdir()] == []
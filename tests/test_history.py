@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from traffic_sim.entities.history import HistoryRecorder
+
+
+@pytest.mark.parametrize('every', [1, 3])
+def test_run_length_series_round_trip(every):
+    rng = np.random.default_rng(0)
+    recorder = HistoryRecorder(seconds=100, every=every)
+    recorder.add_series('light', run_length=True)
+    recorder.add_series('queue', n_cols=2)
+
+    ticks = []
+    t = 0
+    while t < 500:
+        light = int(rng.integers(3))
+        queue = rng.integers(10, size=2)
+        n_ticks = int(rng.integers(1, 8))
+        t += n_ticks
+        recorder.record({'light': light, 'queue': queue}, t, n_ticks)
+        ticks += [(light, queue)] * n_ticks
+
+    sampled = ticks[::every]
+    assert recorder.num_samples == len(sampled)
+    assert recorder.series('light').tolist() == [light for light, _ in sampled]
+    assert (recorder.series('queue') == np.array([queue for _, queue in sampled])).all()
+
+    starts, values = recorder.runs('light')
+    assert len(starts) == 1 + np.count_nonzero(np.diff([light for light, _ in sampled]))
+
+    hist = recorder.to_dict()
+    assert hist['light'].tolist() == recorder.series('light').tolist()
+    assert (hist['queue'][1] == recorder.series('queue')[:, 1]).all()
@@ -0,0 +1,46 @@
+import pytest
+from traffic_sim.simulator import sim
+from traffic_sim.strategies import ConstantController, IdleController, SnapshotController
+
+STRATEGIES = [
+    (ConstantController, {'wait_time': 20}),
+    (IdleController, {'wait_time': 20, 'idle_time': 5}),
+    (SnapshotController, {'rate_lookback': 300, 'loop_duration': 60}),
+]
+
+
+def _summary(c) -> tuple:
+    return c.clock.time, c.num_passed, c.num_active, c.total_frustration, c.active_lane_num
+
+
+@pytest.mark.parametrize('controller, strategy_kwargs', STRATEGIES)
+def test_event_driven_matches_ticks(sim_kwargs, controller, strategy_kwargs):
+    ticked = sim(controller, duration_hours=3, seed=1, save_hist=True, **strategy_kwargs, **sim_kwargs)
+    event = sim(controller, duration_hours=3, seed=1, save_hist=True, event_driven=True, **strategy_kwargs,
+                **sim_kwargs)
+
+    assert _summary(event) == pytest.approx(_summary(ticked))
+    assert (event.hist.series('lane_activity') == ticked.hist.series('lane_activity')).all()
+
+
+def test_event_driven_and_time_step_are_exclusive(sim_kwargs):
+    with pytest.raises(ValueError, match='event_driven'):
+        sim(ConstantController, duration_hours=0.1, event_driven=True, time_step=5, wait_time=20, **sim_kwargs)
+
+
+@pytest.mark.parametrize('controller, strategy_kwargs', STRATEGIES)
+def test_adaptive_steps_match_ticks(sim_kwargs, controller, strategy_kwargs):
+    ticked = sim(controller, duration_hours=3, seed=2, **strategy_kwargs, **sim_kwargs)
+    stepped = sim(controller, duration_hours=3, seed=2, time_step=30, **strategy_kwargs, **sim_kwargs)
+
+    assert _summary(stepped) == pytest.approx(_summary(ticked))
+
+
+def test_snapshot_reestimates_rates_with_coarse_steps(sim_kwargs):
+    snapshot_kwargs = {'rate_lookback': 300, 'loop_duration': 60}
+    kwargs = dict(duration_hours=9, seed=2, time_step=5, adaptive_step=False, **sim_kwargs)
+    snapshot = sim(SnapshotController, **snapshot_kwargs, **kwargs)
+    uniform = sim(ConstantController, wait_time=20, **kwargs)
+
+    assert all(lane.entry_rate_estimate > 0 for lane in snapshot.lanes)
+    assert snapshot.total_frustration != pytest.approx(uniform.total_frustration)
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+from traffic_sim.simulator import sim
+from traffic_sim.strategies import IdleController
+from traffic_sim.trace import trace_lanes_config, write_trace
+
+
+def _arrival_times(lane) -> np.ndarray:
+    return np.concatenate([lane.passed_arrival_times.to_array(), lane.active_arrival_times.to_array()])
+
+
+@pytest.mark.parametrize('event_driven', [False, True])
+def test_trace_replay_reproduces_recorded_run(tmp_path, sim_kwargs, event_driven):
+    recorded = sim(IdleController, duration_hours=2, seed=4, wait_time=20, idle_time=5, **sim_kwargs)
+    write_trace(tmp_path, [_arrival_times(lane) for lane in recorded.lanes], origin=0)
+
+    sim_kwargs['lanes_config'] = trace_lanes_config(tmp_path)
+    replayed = sim(IdleController, duration_hours=2, event_driven=event_driven, wait_time=20, idle_time=5,
+                   **sim_kwargs)
+
+    for recorded_lane, replayed_lane in zip(recorded.lanes, replayed.lanes):
+        assert (_arrival_times(replayed_lane) == _arrival_times(recorded_lane)).all()
+    assert replayed.num_passed == recorded.num_passed
+    assert replayed.total_frustration == pytest.approx(recorded.total_frustration)
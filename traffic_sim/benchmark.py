@@ -0,0 +1,256 @@
+"""
+Benchmarks of the simulation hot paths.
+
+Every benchmark reports its throughput in simulated seconds per wall-clock second (or calls per second for single
+methods), and its peak traced memory. Results can be saved as a JSON baseline, and later runs compared against it:
+
+    python -m traffic_sim.benchmark --save baseline.json
+    python -m traffic_sim.benchmark --compare baseline.json --threshold 0.2
+"""
+from traffic_sim.strategies import *
+from traffic_sim.entities.lane import Lane
+from traffic_sim.simulator import sim, main
+from traffic_sim.utils import Clock, FRUSTRATION_MAP, RateProfile
+from typing import Callable
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+
+LANES_CONFIG = [
+    {'morning_peak_rate': 10, 'evening_peak_rate': 20},
+    {'morning_peak_rate': 15, 'evening_peak_rate': 15},
+    {'morning_peak_rate': 20, 'evening_peak_rate': 10},
+]
+
+STRATEGIES = {
+    'constant': (ConstantController, {'wait_time': 20}),
+    'idle': (IdleController, {'wait_time': 20, 'idle_time': 5}),
+    'snapshot': (SnapshotController, {'rate_lookback': 300, 'loop_duration': 60}),
+}
+
+
+def _lanes_config() -> list[dict]:
+    return [{'traffic_rate_fn': RateProfile(**params)} for params in LANES_CONFIG]
+
+
+def _sim_kwargs() -> dict:
+    return dict(lanes_config=_lanes_config(), exit_rate=1, frustration_fn=FRUSTRATION_MAP['quad'])
+
+
+def _make_controller(strategy: str, seed: int = 0):
+    controller, kwargs = STRATEGIES[strategy]
+    return controller(**_sim_kwargs(), rng=np.random.default_rng(seed), **kwargs)
+
+
+def bench_lane_update(seconds: int) -> tuple[Callable, Callable]:
+    """
+    Lane.update_new_active on a single lane, without any exits.
+    """
+    def setup():
+        clock = Clock()
+        lane = Lane(clock=clock, frustration_fn=FRUSTRATION_MAP['quad'], rng=np.random.default_rng(0),
+                    **_lanes_config()[1])
+        return clock, lane
+
+    def run(state):
+        clock, lane = state
+        for _ in range(seconds):
+            clock.tick()
+            lane.update_new_active()
+
+    return setup, run
+
+
+def bench_run_iter(strategy: str, seconds: int) -> tuple[Callable, Callable]:
+    """
+    Controller.run_iter of a strategy, tick by tick.
+    """
+    def setup():
+        return _make_controller(strategy)
+
+    def run(c):
+        for _ in range(seconds):
+            c.run_iter()
+
+    return setup, run
+
+
+def _reset_loop_start(c: SnapshotController) -> None:
+    """
+    Puts a SnapshotController back at the first decision of a new loop, with no cached split.
+    """
+    c.active_lane_num = 0
+    c.active_lane = c.lanes[0]
+    c.active_lane.active_since = c.clock.time - 1
+    c._loop_start = None
+    c._last_split = None
+
+
+def bench_snapshot_loop_start(calls: int) -> tuple[Callable, Callable]:
+    """
+    SnapshotController.is_time_up at the start of a loop, where the entry rates are estimated and the split is
+    solved. The loop start and cached split are reset before every call.
+    """
+    def setup():
+        c = _make_controller('snapshot')
+        while c.clock.time < 600:
+            c.run_iter()
+
+        # guard against the benchmark drifting from the controller's loop start detection
+        n_solved = []
+        c.optimal_split = lambda: n_solved.append(1) or SnapshotController.optimal_split(c)
+        for _ in range(2):
+            _reset_loop_start(c)
+            c.is_time_up()
+        del c.optimal_split
+        assert len(n_solved) == 2, 'bench_snapshot_loop_start no longer reaches SnapshotController.optimal_split'
+        return c
+
+    def run(c):
+        for _ in range(calls):
+            _reset_loop_start(c)
+            c.is_time_up()
+
+    return setup, run
+
+
+def bench_sim(strategy: str, hours: float, event_driven: bool) -> tuple[Callable, Callable]:
+    """
+    A full sim() run of a strategy.
+    """
+    controller, kwargs = STRATEGIES[strategy]
+
+    def run(_):
+        sim(controller, **_sim_kwargs(), duration_hours=hours, seed=0, event_driven=event_driven, **kwargs)
+
+    return lambda: None, run
+
+
+def bench_main(strategy: str, n_sim: int, hours: float) -> tuple[Callable, Callable]:
+    """
+    A full main() run of a strategy over the process pool. Only the memory of the parent process is traced.
+    """
+    controller, kwargs = STRATEGIES[strategy]
+
+    def run(_):
+        with contextlib.redirect_stdout(io.StringIO()):
+            main(controller, n_sim, **_sim_kwargs(), duration_hours=hours, seed=0, **kwargs)
+
+    return lambda: None, run
+
+
+def benchmarks(quick: bool = False) -> dict:
+    """
+    Returns every benchmark as name -> (setup, run, amount of work, unit of work).
+
+    Parameters
+    ----------
+    quick : bool, optional
+        Whether to skip the longest horizons and pool sizes, by default False.
+    """
+    hour = 60 * 60
+    horizons = [1, 24] if quick else [1, 24, 7 * 24]
+    pool_sizes = [1, 4] if quick else [1, 4, 16]
+
+    suite = {'lane.update_new_active': (*bench_lane_update(hour), hour, 'sim_s')}
+    for strategy in STRATEGIES:
+        suite[f'run_iter.{strategy}'] = (*bench_run_iter(strategy, hour), hour, 'sim_s')
+    suite['snapshot.is_time_up_loop_start'] = (*bench_snapshot_loop_start(1000), 1000, 'calls')
+
+    for strategy in STRATEGIES:
+        for hours in horizons:
+            for event_driven in (False, True):
+                mode = 'event' if event_driven else 'tick'
+                suite[f'sim.{strategy}.{hours}h.{mode}'] = (
+                    *bench_sim(strategy, hours, event_driven), hours * hour, 'sim_s'
+                )
+
+    for n_sim in pool_sizes:
+        suite[f'main.constant.n{n_sim}'] = (*bench_main('constant', n_sim, 1), n_sim * hour, 'sim_s')
+    return suite
+
+
+def measure(setup: Callable, run: Callable, work: float, repeat: int = 3) -> dict:
+    """
+    Times the best of repeat runs, then traces the peak memory of one more run.
+
+    Returns
+    -------
+    dict
+        The throughput (work per wall-clock second), the best wall-clock time and the traced peak in MB.
+    """
+    best = np.inf
+    for _ in range(repeat):
+        state = setup()
+        tick = time.perf_counter()
+        run(state)
+        best = min(best, time.perf_counter() - tick)
+
+    state = setup()
+    tracemalloc.start()
+    run(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'throughput': work / best, 'wall_s': best, 'peak_mb': peak / 2 ** 20}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Returns a description of every benchmark whose throughput dropped, or whose peak memory grew, by more than
+    threshold relative to the baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result['throughput'] < base['throughput'] * (1 - threshold):
+            change = result['throughput'] / base['throughput'] - 1
+            regressions.append(f'{name}: throughput {change:+.1%}')
+        if result['peak_mb'] > base['peak_mb'] * (1 + threshold):
+            change = result['peak_mb'] / base['peak_mb'] - 1
+            regressions.append(f'{name}: peak memory {change:+.1%}')
+    return regressions
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark the simulation hot paths.')
+    parser.add_argument('--save', help='Write the results to this JSON baseline.')
+    parser.add_argument('--compare', help='Compare the results against this JSON baseline.')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Relative change flagged as a regression.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs of every benchmark.')
+    parser.add_argument('--filter', default='', help='Only run the benchmarks whose name contains this.')
+    parser.add_argument('--quick', action='store_true', help='Skip the 7-day horizon and the largest pool.')
+    args = parser.parse_args()
+
+    results = {}
+    for name, (setup, run, work, unit) in benchmarks(args.quick).items():
+        if args.filter not in name:
+            continue
+        results[name] = {**measure(setup, run, work, args.repeat), 'unit': f'{unit}/s'}
+        r = results[name]
+        print(f'{name:<40} {r["throughput"]:>14,.0f} {r["unit"]:<8} {r["wall_s"]:>8.3f}s {r["peak_mb"]:>9.2f}MB')
+
+    if args.save:
+        meta = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine()}
+        with open(args.save, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print(f'No regression beyond {args.threshold:.0%}.')
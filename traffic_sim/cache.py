@@ -0,0 +1,154 @@
+from traffic_sim.results import SimulationResult
+from traffic_sim.utils import RateProfile
+from functools import cache, partial
+from pathlib import Path
+import hashlib
+import json
+import os
+import pickle
+import uuid
+import numpy as np
+
+
+@cache
+def code_version() -> str:
+    """
+    Returns a hash of the source of the traffic_sim package. It salts every cache key, so that changing the code
+    invalidates the results computed by the previous version.
+    """
+    digest = hashlib.sha256()
+    root = Path(__file__).parent
+    for path in sorted(root.rglob('*.py')):
+        digest.update(str(path.relative_to(root)).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def _canonical(obj):
+    """
+    Converts a simulation input into plain JSON-serialisable values which do not depend on object identity.
+
+    Raises
+    ------
+    TypeError
+        If obj is a callable which can neither be named nor described by its attributes.
+    """
+    if isinstance(obj, RateProfile):
+        return {'RateProfile': {'resolution': obj.resolution, **_canonical(obj.rate_params)}}
+    if isinstance(obj, np.random.SeedSequence):
+        return {'SeedSequence': [str(obj.entropy), list(obj.spawn_key)]}
+    if isinstance(obj, dict):
+        return {str(k): _canonical(v) for k, v in sorted(obj.items())}
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, partial):
+        return {'partial': [_canonical(obj.func), _canonical(obj.args), _canonical(obj.keywords)]}
+    if isinstance(obj, type) or callable(obj) and hasattr(obj, '__qualname__'):
+        return f'{obj.__module__}.{obj.__qualname__}'
+    if callable(obj) and hasattr(obj, '__dict__'):
+        cls = type(obj)
+        return {f'{cls.__module__}.{cls.__qualname__}': _canonical(vars(obj))}
+    if callable(obj):
+        raise TypeError(f'Cannot build a cache key from the callable {obj!r}, which has no qualified name.')
+    return obj
+
+
+# keyword arguments of sim which do not change the result of a replicate
+_IGNORED_KWARGS = ('verbose', 'event_driven', 'profile')
+
+
+def result_key(sim_kwargs: dict) -> str:
+    """
+    Returns the content address of one replicate: a stable hash of everything which determines its result, i.e.
+    the controller class and its keyword arguments, the lanes' rate parameters, the exit rate, the name of the
+    frustration function, the duration and the seed, salted with the code version.
+
+    Parameters
+    ----------
+    sim_kwargs : dict
+        The keyword arguments of sim for the replicate, including its seed.
+
+    Returns
+    -------
+    str
+        The hex digest of the key.
+    """
+    inputs = {k: v for k, v in sim_kwargs.items() if k not in _IGNORED_KWARGS}
+    inputs['code_version'] = code_version()
+    encoded = json.dumps(_canonical(inputs), sort_keys=True, default=repr)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Class storing the SimulationResult of every replicate on disk under its content address, evicting the least
+    recently used results once the cache exceeds max_bytes.
+
+    Parameters
+    ----------
+    root : str | Path
+        The cache directory. It is created if missing.
+    max_bytes : int
+        Size bound of the cache, by default 1 GB.
+
+    Methods
+    -------
+    get(key) -> SimulationResult | None
+        The cached result, or None on a miss.
+    put(key, result) -> None
+        Stores a result.
+    evict() -> int
+        Deletes the least recently used results until the cache fits max_bytes, returning how many were deleted.
+    """
+
+    def __init__(self, root: str | Path, max_bytes: int = 2 ** 30):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f'{key}.pkl'
+
+    def get(self, key: str) -> SimulationResult | None:
+        path = self._path(key)
+        try:
+            with path.open('rb') as f:
+                result = pickle.load(f)
+            os.utime(path)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        return result
+
+    def put(self, key: str, result: SimulationResult) -> None:
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+        with tmp.open('wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def evict(self) -> int:
+        entries = []
+        for path in self.root.glob('*/*.pkl'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        n_evicted = 0
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            n_evicted += 1
+        return n_evicted
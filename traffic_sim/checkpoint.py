@@ -0,0 +1,96 @@
+from traffic_sim.entities.controller import Controller
+from pathlib import Path
+import copy
+import gzip
+import pickle
+import numpy as np
+
+
+CHECKPOINT_VERSION = 1
+
+
+def save_checkpoint(controller: Controller, path: str | Path) -> None:
+    """
+    Saves the state of a controller: its clock, the queues and random generators of its lanes, its active lane and
+    its strategy's internals. The history and profiler are left out, since a restored controller starts new ones.
+
+    Parameters
+    ----------
+    controller : Controller
+        The controller to save.
+    path : str | Path
+        The gzip-compressed checkpoint file to write.
+    """
+    state = copy.copy(controller)
+    state.hist = None
+    state.profiler = None
+
+    checkpoint = {
+        'version': CHECKPOINT_VERSION,
+        'controller': type(controller).__name__,
+        'time': controller.clock.time,
+        'state': state,
+    }
+    with gzip.open(path, 'wb') as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_checkpoint(path: str | Path) -> Controller:
+    """
+    Loads the controller state saved by save_checkpoint.
+
+    Parameters
+    ----------
+    path : str | Path
+        The checkpoint file.
+
+    Returns
+    -------
+    Controller
+        The saved controller, without history. Pass it as warm_start to a new controller, or as checkpoint to sim.
+
+    Raises
+    ------
+    ValueError
+        If the checkpoint was written by an incompatible version.
+    """
+    with gzip.open(path, 'rb') as f:
+        checkpoint = pickle.load(f)
+
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(
+            f'Checkpoint {path} has version {checkpoint.get("version")}, but version {CHECKPOINT_VERSION} is expected.'
+        )
+    return checkpoint['state']
+
+
+def fork_state(state: Controller | str | Path, seed: int | np.random.SeedSequence = None) -> Controller:
+    """
+    Returns an independent copy of a saved controller state, optionally giving its lanes new random generators.
+
+    Parameters
+    ----------
+    state : Controller | str | Path
+        A controller, or the path of a checkpoint.
+    seed : int | np.random.SeedSequence, optional
+        Seed of the branch. Every lane draws the arrivals after the saved time from a child of it. By default
+        None, keeping the saved generators, so that every branch sees the same future arrivals.
+
+    Returns
+    -------
+    Controller
+        The copy, to be passed as warm_start to a new controller.
+    """
+    if isinstance(state, Controller):
+        state = copy.copy(state)
+        state.hist = None
+        state.profiler = None
+        state = pickle.loads(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+    else:
+        state = load_checkpoint(state)
+
+    if seed is not None:
+        rngs = np.random.default_rng(seed).spawn(state.n_lanes)
+        for lane, rng in zip(state.lanes, rngs):
+            lane.arrivals.reseed(rng, state.clock.time)
+    return state
@@ -0,0 +1,70 @@
+import numpy as np
+from scipy.stats import t as student_t
+
+
+def paired_differences(models: dict, baseline: str = None, confidence: float = 0.95) -> list[dict]:
+    """
+    Compares the average frustration of every model against a baseline, replicate by replicate.
+
+    The models must have been run with common random numbers, i.e. the same root seed, so that replicate k of every
+    model saw exactly the same arrivals. Models which ran a different number of simulations are compared on the
+    replicates they have in common. The noise of the arrivals then cancels out of the
+    paired differences, which need far fewer replicates than comparing independent means.
+
+    Parameters
+    ----------
+    models : dict
+        A dictionary containing model names as keys and the output of simulator.main as values.
+    baseline : str, optional
+        Name of the model every other model is compared to, by default the first one.
+    confidence : float, optional
+        Confidence level of the intervals, by default 0.95.
+
+    Returns
+    -------
+    list[dict]
+        One row per model other than the baseline, holding the mean paired difference (model - baseline), its
+        confidence interval, and the ratio of the paired variance to the variance of an unpaired comparison.
+    """
+    baseline = next(iter(models)) if baseline is None else baseline
+    base = np.asarray(models[baseline]['frustrations'])
+
+    rows = []
+    for model_name, output in models.items():
+        if model_name == baseline:
+            continue
+
+        n = min(len(output['frustrations']), len(base))
+        frustrations = np.asarray(output['frustrations'][:n])
+        diff = frustrations - base[:n]
+        mean = float(diff.mean())
+        half_width = np.nan
+        variance_ratio = np.nan
+        if n > 1:
+            sem = diff.std(ddof=1) / np.sqrt(n)
+            half_width = float(student_t.ppf((1 + confidence) / 2, n - 1) * sem)
+            unpaired_var = frustrations.var(ddof=1) + base[:n].var(ddof=1)
+            variance_ratio = float(diff.var(ddof=1) / unpaired_var) if unpaired_var > 0 else np.nan
+
+        rows.append({
+            'model': model_name,
+            'baseline': baseline,
+            'n_sim': n,
+            'mean_diff': mean,
+            'ci_low': mean - half_width,
+            'ci_high': mean + half_width,
+            'variance_ratio': variance_ratio,
+        })
+    return rows
+
+
+def print_paired_differences(rows: list[dict], confidence: float = 0.95) -> None:
+    """
+    Prints the paired differences returned by paired_differences.
+    """
+    for row in rows:
+        ci = f'[{row["ci_low"]:.4g}, {row["ci_high"]:.4g}]'
+        print(
+            f'{row["model"]} - {row["baseline"]}: {row["mean_diff"]:+.4g} '
+            f'({confidence:.0%} CI {ci}, n={row["n_sim"]}, paired/unpaired variance {row["variance_ratio"]:.3f})'
+        )
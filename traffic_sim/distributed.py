@@ -0,0 +1,373 @@
+"""
+Distributed batch mode over a shared directory.
+
+A coordinator splits the replicates of a run into jobs and writes them into a queue directory, which any number
+of workers, on this host or others mounting the same directory, drain:
+
+    python -m traffic_sim.distributed worker /shared/queue
+
+The queue directory holds four folders. Jobs wait in pending/ and are claimed by atomically renaming them into
+claimed/, suffixed with the id of the worker. While running a job, the worker keeps touching its claim as a
+heartbeat. Results are written into results/, and the coordinator puts claims whose heartbeat stopped back into
+pending/, counting how often in attempts/. Every replicate has its own seed, so a job run twice gives the same
+result. A job which raises, or whose claim went stale too often, leaves a JobFailure in results/ instead, which
+the coordinator raises as a JobFailedError.
+"""
+from traffic_sim.simulator import sim_pool
+from traffic_sim.results import SimulationResult
+from typing import Callable
+from dataclasses import dataclass
+from pathlib import Path
+import multiprocessing
+import os
+import pickle
+import socket
+import sys
+import threading
+import time
+import traceback
+import uuid
+import numpy as np
+
+
+@dataclass
+class JobFailure:
+    """
+    Record written to results/ in place of the results of a job which raised, or whose claim went stale too often.
+    """
+    job_id: str
+    worker_id: str
+    error: str
+    traceback: str = ''
+
+
+class JobFailedError(RuntimeError):
+    """
+    Raised by distributed_main when a job failed, or can no longer be run by any local worker.
+    """
+
+
+class JobQueue:
+    """
+    Class implementing a work queue in a shared directory, using only atomic renames for synchronisation.
+
+    Parameters
+    ----------
+    root : str | Path
+        The queue directory. It is created if missing.
+
+    Methods
+    -------
+    submit(job_id, payload) -> None
+        Adds a job to the queue.
+    claim(worker_id) -> tuple[str, object] | None
+        Atomically takes a pending job, or returns None if there is none.
+    heartbeat(job_id, worker_id) -> None
+        Marks a claimed job as still running.
+    complete(job_id, worker_id, result) -> None
+        Writes the result of a claimed job and releases the claim.
+    results(prefix, skip) -> dict
+        The results whose job id starts with prefix, other than those in skip.
+    claims(prefix) -> list[str]
+        The claimed jobs whose job id starts with prefix.
+    remove_results(job_ids) -> None
+        Deletes merged results.
+    remove_jobs(job_ids) -> None
+        Deletes the pending and claimed jobs, and the requeue counts, of job_ids.
+    requeue_stale(timeout, max_requeues) -> list[str]
+        Puts back the claimed jobs whose heartbeat is older than timeout seconds, failing those requeued too often.
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        self.pending = self.root / 'pending'
+        self.claimed = self.root / 'claimed'
+        self.done = self.root / 'results'
+        self.attempts = self.root / 'attempts'
+        for folder in (self.pending, self.claimed, self.done, self.attempts):
+            folder.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _write_atomic(path: Path, obj) -> None:
+        tmp = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+        with tmp.open('wb') as f:
+            pickle.dump(obj, f)
+        os.replace(tmp, path)
+
+    def submit(self, job_id: str, payload) -> None:
+        self._write_atomic(self.pending / job_id, payload)
+
+    def claim(self, worker_id: str) -> tuple[str, object] | None:
+        for path in sorted(self.pending.iterdir()):
+            if path.name.startswith('.'):
+                continue
+            claim = self.claimed / f'{path.name}@{worker_id}'
+            try:
+                os.rename(path, claim)
+            except FileNotFoundError:
+                continue
+            os.utime(claim)
+            with claim.open('rb') as f:
+                return path.name, pickle.load(f)
+        return None
+
+    def heartbeat(self, job_id: str, worker_id: str) -> None:
+        try:
+            os.utime(self.claimed / f'{job_id}@{worker_id}')
+        except FileNotFoundError:
+            pass
+
+    def complete(self, job_id: str, worker_id: str, result) -> None:
+        self._write_atomic(self.done / job_id, result)
+        try:
+            os.remove(self.claimed / f'{job_id}@{worker_id}')
+        except FileNotFoundError:
+            pass
+
+    def results(self, prefix: str = '', skip=()) -> dict:
+        results = {}
+        for path in self.done.iterdir():
+            if path.name.startswith(prefix) and path.name not in skip:
+                with path.open('rb') as f:
+                    results[path.name] = pickle.load(f)
+        return results
+
+    def claims(self, prefix: str = '') -> list[str]:
+        return [claim.name.rsplit('@', 1)[0] for claim in self.claimed.iterdir() if claim.name.startswith(prefix)]
+
+    def remove_results(self, job_ids) -> None:
+        for job_id in job_ids:
+            try:
+                os.remove(self.done / job_id)
+            except FileNotFoundError:
+                pass
+
+    def remove_jobs(self, job_ids) -> None:
+        job_ids = set(job_ids)
+        paths = [self.pending / job_id for job_id in job_ids] + [self.attempts / job_id for job_id in job_ids]
+        paths += [claim for claim in self.claimed.iterdir() if claim.name.rsplit('@', 1)[0] in job_ids]
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _count_requeue(self, job_id: str) -> int:
+        path = self.attempts / job_id
+        n_requeues = int(path.read_text()) + 1 if path.exists() else 1
+        path.write_text(str(n_requeues))
+        return n_requeues
+
+    def requeue_stale(self, timeout: float, max_requeues: int = None) -> list[str]:
+        requeued = []
+        now = time.time()
+        for claim in self.claimed.iterdir():
+            job_id, worker_id = claim.name.rsplit('@', 1)
+            try:
+                is_stale = now - claim.stat().st_mtime > timeout
+                if is_stale and not (self.done / job_id).exists():
+                    if max_requeues is not None and self._count_requeue(job_id) > max_requeues:
+                        error = f'Its claim went stale {max_requeues + 1} times, the workers running it died or stalled.'
+                        self._write_atomic(self.done / job_id, JobFailure(job_id, worker_id, error))
+                        os.remove(claim)
+                    else:
+                        os.rename(claim, self.pending / job_id)
+                        requeued.append(job_id)
+                elif is_stale:
+                    os.remove(claim)
+            except FileNotFoundError:
+                continue
+        return requeued
+
+
+def run_job(payload: dict) -> list[SimulationResult]:
+    """
+    Runs the replicates of a job, given as the shared sim keyword arguments and one seed per replicate.
+    """
+    return [sim_pool({**payload['sim_kwargs'], 'seed': seed}) for seed in payload['seeds']]
+
+
+def run_worker(
+        root: str | Path,
+        worker_id: str = None,
+        poll: float = 1.0,
+        heartbeat: float = 10.0,
+        stop_when_idle: float = None,
+        stop=None,
+) -> int:
+    """
+    Claims and runs jobs from the queue at root until stopped. A job which raises is completed with a JobFailure
+    holding the traceback, and the worker moves on to the next job.
+
+    Parameters
+    ----------
+    root : str | Path
+        The queue directory.
+    worker_id : str, optional
+        Unique id of the worker, by default made of the host name, process id and a random suffix.
+    poll : float, optional
+        Seconds to wait before looking again when no job is pending, by default 1.
+    heartbeat : float, optional
+        Seconds between two heartbeats of the running job, by default 10. Must be well below the coordinator's
+        timeout.
+    stop_when_idle : float, optional
+        Stop once no job was pending for this many seconds, by default None (never stop).
+    stop : multiprocessing.Event, optional
+        Stop once this event is set and no job is pending, by default None.
+
+    Returns
+    -------
+    int
+        The number of jobs run.
+    """
+    queue = JobQueue(root)
+    worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}'
+    n_jobs = 0
+    idle_since = time.time()
+
+    while True:
+        job = queue.claim(worker_id)
+        if job is None:
+            if stop_when_idle is not None and time.time() - idle_since > stop_when_idle:
+                return n_jobs
+            if stop is not None and stop.is_set():
+                return n_jobs
+            time.sleep(poll)
+            continue
+
+        job_id, payload = job
+        running = threading.Event()
+        running.set()
+
+        def beat():
+            while running.is_set():
+                queue.heartbeat(job_id, worker_id)
+                time.sleep(heartbeat)
+
+        beater = threading.Thread(target=beat, daemon=True)
+        beater.start()
+        try:
+            results = run_job(payload)
+        except Exception as e:
+            results = JobFailure(job_id, worker_id, repr(e), traceback.format_exc())
+        finally:
+            running.clear()
+        queue.complete(job_id, worker_id, results)
+
+        n_jobs += 1
+        idle_since = time.time()
+
+
+def distributed_main(
+    controller: Callable,
+    n_sim: int,
+    queue_dir: str | Path,
+    replicates_per_job: int = 1,
+    seed: int = None,
+    timeout: float = 60.0,
+    poll: float = 1.0,
+    n_local_workers: int = 0,
+    max_requeues: int = 3,
+    **sim_kwargs
+) -> dict:
+    """
+    Runs n_sim simulations through the shared-directory queue at queue_dir, and merges the results as they arrive.
+
+    Parameters
+    ----------
+    controller : Callable
+        The controller function to control the traffic flow.
+    n_sim : int
+        Number of simulations to run.
+    queue_dir : str | Path
+        The queue directory, shared with the workers.
+    replicates_per_job : int, optional
+        Number of consecutive replicates run by every job, by default 1.
+    seed : int, optional
+        Root seed of the run. Replicate k gets the same child seed as in simulator.main, so the results match
+        a local run. Defaults to None (fresh entropy).
+    timeout : float, optional
+        Seconds without a heartbeat after which a claimed job is considered lost and put back in the queue,
+        by default 60.
+    poll : float, optional
+        Seconds between two checks of the queue, by default 1.
+    n_local_workers : int, optional
+        Number of worker processes to start on this host, which stop once every result arrived, by default 0.
+    max_requeues : int, optional
+        Number of times a job whose claim went stale is put back in the queue before it is failed, by default 3.
+    **sim_kwargs
+        Additional keyword arguments to be passed to sim.
+
+    Returns
+    -------
+    dict
+        The average frustration of every simulation under 'frustrations' and their SimulationResult summaries
+        under 'results', in replicate order.
+
+    Raises
+    ------
+    JobFailedError
+        If a job raised or was requeued more than max_requeues times, or if local workers were started and all of
+        them exited while jobs were still unfinished and unclaimed. The run's remaining jobs are then removed from
+        the queue.
+    """
+    queue = JobQueue(queue_dir)
+    run_id = uuid.uuid4().hex[:8]
+    seeds = np.random.SeedSequence(seed).spawn(n_sim)
+    job_kwargs = {**sim_kwargs, 'controller': controller}
+
+    job_ids = []
+    for start in range(0, n_sim, replicates_per_job):
+        job_id = f'{run_id}-{start:08d}'
+        queue.submit(job_id, {'sim_kwargs': job_kwargs, 'seeds': seeds[start:start + replicates_per_job]})
+        job_ids.append(job_id)
+
+    stop = multiprocessing.Event()
+    workers = [
+        multiprocessing.Process(target=run_worker, args=(queue_dir,), kwargs={'poll': poll, 'stop': stop})
+        for _ in range(n_local_workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    print(f'Running distributed simulations ({controller.__name__}, {len(job_ids)} jobs)...', end='')
+    results = {}
+    failed = True
+    try:
+        while len(results) < len(job_ids):
+            results.update(queue.results(prefix=run_id, skip=results))
+            for result in results.values():
+                if isinstance(result, JobFailure):
+                    raise JobFailedError(
+                        f'Job {result.job_id} failed on worker {result.worker_id}: {result.error}\n{result.traceback}'
+                    )
+            if len(results) < len(job_ids):
+                queue.requeue_stale(timeout, max_requeues)
+                if workers and not any(worker.is_alive() for worker in workers) and not queue.claims(run_id):
+                    raise JobFailedError(
+                        f'All {len(workers)} local workers exited with {len(job_ids) - len(results)} jobs unfinished.'
+                    )
+                time.sleep(poll)
+        failed = False
+        print('done')
+    finally:
+        stop.set()
+        for worker in workers:
+            if failed:
+                worker.terminate()
+            worker.join()
+        queue.remove_jobs(job_ids)
+        queue.remove_results(job_ids)
+
+    results = [result for job_id in job_ids for result in results[job_id]]
+    frustrations = [result.avg_frustration for result in results]
+    return {'frustrations': frustrations, 'results': results}
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 3 or sys.argv[1] != 'worker':
+        print('Usage: python -m traffic_sim.distributed worker <queue_dir>')
+        sys.exit(1)
+
+    run_worker(sys.argv[2])
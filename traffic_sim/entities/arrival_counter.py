@@ -0,0 +1,108 @@
+import numpy as np
+from traffic_sim.utils import Clock
+
+
+class ArrivalCounter:
+
+    def __init__(self, clock: Clock):
+        """
+        Initializes an ArrivalCounter, a bucketed ring of per-second arrival counts which keeps a running total for
+        every registered lookback window.
+
+        Parameters
+        ----------
+        clock : Clock
+            The clock object to keep track of time.
+
+        Notes
+        -----
+        Arrivals older than the longest registered window are forgotten. Windows registered mid-simulation, e.g. by a
+        strategy taking over a warm start, must therefore be given the arrival times recorded so far.
+        """
+        self.clock = clock
+        self._time = clock.time
+        self._counts = [0]
+        self._window_counts: dict[int, int] = {}
+
+    @property
+    def windows(self) -> list[int]:
+        return sorted(self._window_counts)
+
+    def add_window(self, lookback: int, arrival_times: np.ndarray = None) -> None:
+        """
+        Registers a lookback window, so that count(lookback) is answered in O(1).
+
+        Parameters
+        ----------
+        lookback : int
+            Cars which arrived at most lookback seconds ago are counted.
+        arrival_times : np.ndarray, optional
+            The arrival time of every car recorded so far, one entry per car. If given, a ring grown for the window
+            is rebuilt from them, so that arrivals older than the previous windows are counted too. Defaults to None,
+            keeping only the arrivals already in the ring.
+        """
+        if lookback in self._window_counts:
+            return
+
+        self.advance()
+        if lookback + 1 > len(self._counts) and arrival_times is not None:
+            capacity = lookback + 1
+            arrival_times = np.asarray(arrival_times)
+            recent = arrival_times[(arrival_times > self._time - capacity) & (arrival_times <= self._time)]
+            self._counts = [0] * capacity
+            for t, n in zip(*np.unique(recent, return_counts=True)):
+                self._counts[int(t) % capacity] = int(n)
+            self._window_counts = {window: self._sum_last(window) for window in self._window_counts}
+        elif lookback + 1 > len(self._counts):
+            capacity = len(self._counts)
+            ordered = [self._counts[(self._time - i) % capacity] for i in range(capacity)]
+            ordered += [0] * (lookback + 1 - capacity)
+            self._counts = [0] * (lookback + 1)
+            for i, n in enumerate(ordered):
+                self._counts[(self._time - i) % len(self._counts)] = n
+
+        self._window_counts[lookback] = self._sum_last(lookback)
+
+    def _sum_last(self, lookback: int) -> int:
+        capacity = len(self._counts)
+        return sum(self._counts[(self._time - i) % capacity] for i in range(min(lookback + 1, capacity)))
+
+    def advance(self, t: int = None) -> None:
+        """
+        Moves the ring forward to time t, by default the current time, dropping the arrivals which fall out of each
+        window.
+        """
+        t = self.clock.time if t is None else t
+        capacity = len(self._counts)
+        if t - self._time >= capacity:
+            self._counts = [0] * capacity
+            self._window_counts = dict.fromkeys(self._window_counts, 0)
+            self._time = t
+            return
+
+        for s in range(self._time + 1, t + 1):
+            for lookback in self._window_counts:
+                self._window_counts[lookback] -= self._counts[(s - lookback - 1) % capacity]
+            self._counts[s % capacity] = 0
+        self._time = max(self._time, t)
+
+    def record(self, num_cars: int, t: int = None) -> None:
+        """
+        Records num_cars arrivals at time t, by default the current time.
+        """
+        self.advance(t)
+        self._counts[self._time % len(self._counts)] += num_cars
+        for lookback in self._window_counts:
+            self._window_counts[lookback] += num_cars
+
+    def count(self, lookback: int) -> int:
+        """
+        Returns the number of cars which arrived at most lookback seconds ago.
+        Unregistered windows shorter than the longest registered one are summed from the ring.
+        """
+        self.advance()
+        if lookback in self._window_counts:
+            return self._window_counts[lookback]
+        if lookback + 1 > len(self._counts):
+            raise ValueError(f'Lookback of {lookback}s is longer than any registered window.')
+        return self._sum_last(lookback)
@@ -0,0 +1,265 @@
+from bisect import bisect_left
+from pathlib import Path
+
+import numpy as np
+from typing import Callable
+
+
+class PoissonArrivals:
+
+    def __init__(self, traffic_rate_fn: Callable, chunk_seconds: int = 3600, rng: np.random.Generator = None):
+        """
+        Initializes a PoissonArrivals source which pre-samples the number of cars arriving every second in chunks.
+
+        Parameters
+        ----------
+        traffic_rate_fn : Callable
+            The function that calculates the traffic rate (cars per minute) from the time in hours.
+            If it exposes rates_between(start, stop), as RateProfile does, the rates of a chunk are read from it
+            in a single call.
+        chunk_seconds : int, optional
+            Number of seconds sampled per chunk, by default 3600. Bounds the memory held by the source.
+        rng : np.random.Generator, optional
+            The random generator to sample from. Defaults to a freshly seeded one.
+        """
+        self.traffic_rate_fn = traffic_rate_fn
+        self.chunk_seconds = chunk_seconds
+        self.rng = np.random.default_rng() if rng is None else rng
+
+        self._start = 0
+        self._counts = np.zeros(0, dtype=np.int32)
+        self._arrival_offsets = []
+        # seconds in [_empty_from, _start) are known to have no arrivals
+        self._empty_from = 0
+
+    def rates_between(self, start: int, stop: int) -> np.ndarray:
+        """
+        Returns the traffic rate for every second in [start, stop).
+        """
+        if hasattr(self.traffic_rate_fn, 'rates_between'):
+            return self.traffic_rate_fn.rates_between(start, stop)
+        return np.array([self.traffic_rate_fn(t / 60 / 60) for t in range(start, stop)])
+
+    def sample_chunk(self, start: int) -> None:
+        """
+        Samples the arrivals of every second in [start, start + chunk_seconds) in one vectorised draw.
+        """
+        rates = self.rates_between(start, start + self.chunk_seconds)
+        self._counts = self.rng.poisson(rates / 60).astype(np.int32)
+        self._arrival_offsets = np.flatnonzero(self._counts).tolist()
+        self._start = start
+        self._empty_from = start
+
+    def reseed(self, rng: np.random.Generator, t: int) -> None:
+        """
+        Replaces the random generator, discarding the arrivals already sampled after second t so that every later
+        second is drawn from rng.
+        """
+        self.rng = rng
+        keep = max(0, t + 1 - self._start)
+        if keep < len(self._counts):
+            self._counts = self._counts[:keep]
+            self._arrival_offsets = self._arrival_offsets[:bisect_left(self._arrival_offsets, keep)]
+        if keep == 0:
+            self._start = t + 1
+            self._empty_from = min(self._empty_from, t + 1)
+
+    def num_arrivals(self, t: int) -> int:
+        """
+        Returns the number of cars arriving at second t, sampling a new chunk when t falls outside the current one.
+        """
+        i = t - self._start
+        if 0 <= i < len(self._counts):
+            return int(self._counts[i])
+        if self._empty_from <= t < self._start:
+            return 0
+
+        self.sample_chunk(t)
+        return int(self._counts[0])
+
+    def next_arrival_time(self, t: int, until: float = np.inf) -> float:
+        """
+        Finds the first second at or after t in which at least one car arrives.
+
+        Parameters
+        ----------
+        t : int
+            The first second to consider.
+        until : float, optional
+            Stop sampling new chunks once this time is reached, by default never.
+
+        Returns
+        -------
+        float
+            The time of the next arrival, or np.inf if there is none before until.
+        """
+        if not self._empty_from <= t < self._start + len(self._counts):
+            self.sample_chunk(t)
+
+        empty_from = t
+        t = max(t, self._start)
+        while t < until:
+            k = bisect_left(self._arrival_offsets, t - self._start)
+            if k < len(self._arrival_offsets):
+                return self._start + self._arrival_offsets[k]
+
+            # keep chunks contiguous, remembering that everything scanned so far was empty
+            self.sample_chunk(self._start + len(self._counts))
+            self._empty_from = empty_from
+            t = self._start
+
+        return np.inf
+
+
+class SensorArrivals:
+
+    def __init__(self):
+        """
+        Initializes a SensorArrivals source, which is fed the cars detected by a sensor instead of sampling them.
+        Cars reported since the last tick arrive at the next one, as traffic_sim.realtime does in real time.
+        """
+        self._num_reported = 0
+
+    def report(self, num_cars: int = 1) -> None:
+        """
+        Records num_cars cars detected by the sensor.
+        """
+        self._num_reported += num_cars
+
+    def num_arrivals(self, t: int) -> int:
+        """
+        Returns the number of cars reported since the previous call, which all arrive at second t.
+        """
+        num_cars = self._num_reported
+        self._num_reported = 0
+        return num_cars
+
+    def next_arrival_time(self, t: int, until: float = np.inf) -> float:
+        """
+        Returns t if cars were reported and not yet collected, since future detections are unknown, or np.inf.
+        """
+        return t if self._num_reported > 0 and t < until else np.inf
+
+
+class TraceArrivals:
+
+    def __init__(self, path: str | Path, lane: int, start: int = 0, chunk_size: int = 4096):
+        """
+        Initializes a TraceArrivals source, which replays the cars recorded for one lane of a trace written by
+        traffic_sim.trace.write_trace. The arrival times are memory-mapped, and a cursor walks through them in
+        chunks, so that replaying a long trace neither loads it nor allocates at every tick.
+
+        Parameters
+        ----------
+        path : str | Path
+            The trace directory.
+        lane : int
+            The lane of the trace to replay.
+        start : int, optional
+            The second of the trace replayed at time 0 of the simulation, by default 0. Sources with different
+            starts replay different windows of the same trace.
+        chunk_size : int, optional
+            Number of arrival times read from the trace at once, by default 4096.
+        """
+        self.path = Path(path)
+        self.lane = lane
+        self.start = start
+        self.chunk_size = chunk_size
+        self._init_cursor()
+
+    def _init_cursor(self) -> None:
+        self._times = None
+        # arrival times of the current chunk relative to start, the position of the cursor in it, and the last
+        # time before which every arrival was consumed
+        self._chunk = []
+        self._chunk_end = 0
+        self._i = 0
+        self._consumed = np.inf
+
+    def __getstate__(self) -> dict:
+        # only the location of the trace is sent to pool workers, which map it themselves
+        return {'path': self.path, 'lane': self.lane, 'start': self.start, 'chunk_size': self.chunk_size}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._init_cursor()
+
+    def __repr__(self) -> str:
+        return f'TraceArrivals({str(self.path)!r}, lane={self.lane}, start={self.start})'
+
+    @property
+    def times(self) -> np.ndarray:
+        """
+        The memory-mapped arrival times of the lane, in seconds from the start of the trace.
+        """
+        if self._times is None:
+            self._times = np.load(self.path / f'lane_{self.lane}.npy', mmap_mode='r')
+        return self._times
+
+    def _seek(self, t: int) -> None:
+        """
+        Moves the cursor to the first arrival at or after time t.
+        """
+        k = int(np.searchsorted(self.times, max(0, self.start + t)))
+        self._load(k)
+        self._consumed = t - 1
+
+    def _load(self, k: int) -> bool:
+        chunk = self.times[k:k + self.chunk_size]
+        self._chunk = (chunk.astype(np.int64) - self.start).tolist()
+        self._chunk_end = k + len(chunk)
+        self._i = 0
+        return len(chunk) > 0
+
+    def _skip_before(self, t: int) -> float:
+        """
+        Moves the cursor past the arrivals before time t, returning the time of the next one, or np.inf if the
+        trace ended.
+        """
+        if t <= self._consumed:
+            self._seek(t)
+        while True:
+            if self._i == len(self._chunk) and not self._load(self._chunk_end):
+                return np.inf
+            arrival = self._chunk[self._i]
+            if arrival >= t:
+                return arrival
+            self._i += 1
+
+    def num_arrivals(self, t: int) -> int:
+        """
+        Returns the number of cars recorded at second t, moving the cursor past them. Times are expected to
+        increase between calls; an earlier time moves the cursor back.
+        """
+        num_cars = 0
+        arrival = self._skip_before(t)
+        while arrival == t:
+            num_cars += 1
+            self._i += 1
+            arrival = self._skip_before(t)
+        self._consumed = t
+        return num_cars
+
+    def next_arrival_time(self, t: int, until: float = np.inf) -> float:
+        """
+        Returns the first second at or after t at which a car was recorded, or np.inf if there is none before until.
+        """
+        arrival = self._skip_before(t)
+        self._consumed = t - 1
+        return arrival if arrival < until else np.inf
+
+    def reseed(self, rng: np.random.Generator, t: int) -> None:
+        """
+        Does nothing, since a recorded trace is the same for every seed.
+        """
+
+    def rate(self, t_hours: float | np.ndarray, window: int = 900) -> float | np.ndarray:
+        """
+        Returns the recorded traffic rate in cars per minute, averaged over window seconds centred on t_hours, so
+        that the source can serve as the lane's traffic_rate_fn.
+        """
+        t = np.asarray(t_hours) * 60 * 60 + self.start
+        lo = np.searchsorted(self.times, t - window / 2)
+        hi = np.searchsorted(self.times, t + window / 2)
+        rate = (hi - lo) / window * 60
+        return float(rate) if np.ndim(rate) == 0 else rate
@@ -0,0 +1,248 @@
+import numpy as np
+from traffic_sim.utils import Clock
+from traffic_sim.entities.arrivals import PoissonArrivals
+from typing import List, Callable
+
+
+def check_batch_lanes(lanes_config: List[dict]) -> None:
+    """
+    Raises a NotImplementedError if a lane configuration carries its own arrivals source, e.g. a TraceArrivals or
+    SensorArrivals, since the batch engine only samples Poisson arrivals from traffic_rate_fn.
+    """
+    for i, lane_config in enumerate(lanes_config):
+        if lane_config.get('arrivals') is not None:
+            raise NotImplementedError(
+                f'Lane {i} has a custom arrivals source ({type(lane_config["arrivals"]).__name__}), which the batch '
+                f'engine cannot replay. Run it without vectorised instead.'
+            )
+
+
+class BatchController:
+
+    def __init__(
+            self,
+            strategy: type,
+            n_sim: int,
+            lanes_config: List[dict],
+            exit_rate: int,
+            frustration_fn: Callable,
+            rng: np.random.Generator = None,
+            seeds: List[np.random.SeedSequence] = None,
+            **strategy_kwargs
+    ):
+        """
+        Initializes a BatchController which advances n_sim independent replicates of the same junction at once.
+        Every per-lane quantity of the Controller/Lane pair is held as an array of shape (n_sim, n_lanes), and the
+        queued cars' arrival times are kept in one FIFO ring buffer per (replicate, lane).
+
+        Parameters
+        ----------
+        strategy : type
+            The Controller subclass whose switching rule is applied. It must implement the static method
+            is_time_up_batch(batch, **strategy_kwargs).
+        n_sim : int
+            Number of replicates to simulate side by side.
+        lanes_config : List[dict]
+            A list of dictionaries representing the configuration of lanes. Only their traffic_rate_fn is used, and
+            lanes with a custom arrivals source are rejected.
+        exit_rate : int
+            The rate at which cars exit the lanes.
+        frustration_fn : Callable
+            A function that calculates the frustration level of cars in the lanes. Must accept numpy arrays.
+        rng : np.random.Generator, optional
+            The random generator to sample arrivals from. Defaults to a freshly seeded one.
+        seeds : List[np.random.SeedSequence], optional
+            One seed per replicate. Lane i of replicate k then draws its arrivals from the same child generator as
+            lane i of a Controller seeded with seeds[k], so that batched and pooled replicates on the same seeds see
+            exactly the same arrivals. Defaults to None, drawing every replicate from rng.
+        **strategy_kwargs
+            Keyword arguments forwarded to the strategy's is_time_up_batch.
+        """
+        if not hasattr(strategy, 'is_time_up_batch'):
+            raise NotImplementedError(f'{strategy.__name__} does not implement is_time_up_batch.')
+        check_batch_lanes(lanes_config)
+
+        self.strategy = strategy
+        self.strategy_kwargs = strategy_kwargs
+
+        self.clock = Clock()
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.exit_rate = exit_rate
+        self.frustration_fn = frustration_fn
+        self.traffic_rate_fns = [lane_config['traffic_rate_fn'] for lane_config in lanes_config]
+        self.arrivals = [PoissonArrivals(traffic_rate_fn) for traffic_rate_fn in self.traffic_rate_fns]
+
+        self.n_sim = n_sim
+        self.n_lanes = len(lanes_config)
+        if seeds is not None and len(seeds) != n_sim:
+            raise ValueError(f'Expected {n_sim} seeds, one per replicate, got {len(seeds)}.')
+        self.lane_rngs = None if seeds is None else [np.random.default_rng(s).spawn(self.n_lanes) for s in seeds]
+        shape = (self.n_sim, self.n_lanes)
+        self.replicates = np.arange(self.n_sim)
+
+        self.active_since = np.full(shape, -np.inf)
+        self.last_active_time = np.full(shape, -np.inf)
+        self.last_exit_time = np.full(shape, -np.inf)
+
+        self.num_active_cars = np.zeros(shape, dtype=np.int64)
+        self.num_passed_cars = np.zeros(shape, dtype=np.int64)
+        self.passed_frustration = np.zeros(shape)
+        self.passed_waiting_time = np.zeros(shape)
+        self.max_passed_wait = np.zeros(shape)
+
+        self._capacity = 64
+        self._arrival_times = np.zeros(shape + (self._capacity,), dtype=np.int32)
+        self._head = np.zeros(shape, dtype=np.int64)
+
+        # arrivals are pre-sampled for a block of ticks at a time, keeping each block around a million counts
+        self.chunk_seconds = int(np.clip(2 ** 20 // (self.n_sim * self.n_lanes), 1, 3600))
+        self._chunk_start = 0
+        self._arrival_counts = np.zeros((0,) + shape, dtype=np.int32)
+
+        # mirrors Controller.run_next_lane being called once on construction
+        self.active_lane_num = np.zeros(self.n_sim, dtype=np.int64)
+        self.last_active_time[:, -1] = self.clock.time
+        self.active_since[:, 0] = self.clock.time
+
+    @property
+    def active_lane_since(self) -> np.ndarray:
+        return self.active_since[self.replicates, self.active_lane_num]
+
+    @property
+    def active_lane_last_exit_time(self) -> np.ndarray:
+        return self.last_exit_time[self.replicates, self.active_lane_num]
+
+    @property
+    def active_lane_num_cars(self) -> np.ndarray:
+        return self.num_active_cars[self.replicates, self.active_lane_num]
+
+    @property
+    def lane_active_frustration(self) -> np.ndarray:
+        offset = (np.arange(self._capacity) - self._head[..., None]) % self._capacity
+        is_queued = offset < self.num_active_cars[..., None]
+        waits = self.clock.time - self._arrival_times.astype(np.float64)
+        return np.where(is_queued, self.frustration_fn(waits), 0).sum(axis=2)
+
+    @property
+    def active_frustration(self) -> np.ndarray:
+        return self.lane_active_frustration.sum(axis=1)
+
+    @property
+    def num_active(self) -> np.ndarray:
+        return self.num_active_cars.sum(axis=1)
+
+    @property
+    def num_passed(self) -> np.ndarray:
+        return self.num_passed_cars.sum(axis=1)
+
+    @property
+    def total_frustration(self) -> np.ndarray:
+        return self.active_frustration + self.passed_frustration.sum(axis=1)
+
+    def _grow(self, min_capacity: int) -> None:
+        """
+        Unrolls every ring buffer so that its oldest car sits at index 0 and enlarges the buffers to hold at least
+        min_capacity cars.
+        """
+        capacity = max(2 * self._capacity, min_capacity)
+        idx = (self._head[..., None] + np.arange(self._capacity)) % self._capacity
+        arrival_times = np.zeros(self._arrival_times.shape[:2] + (capacity,), dtype=np.int32)
+        arrival_times[..., :self._capacity] = np.take_along_axis(self._arrival_times, idx, axis=2)
+
+        self._arrival_times = arrival_times
+        self._head[:] = 0
+        self._capacity = capacity
+
+    def sample_chunk(self, start: int) -> None:
+        """
+        Samples the incoming cars of every lane in every replicate for chunk_seconds ticks from start in one draw,
+        or in one draw per (replicate, lane) from their own generators when seeded per replicate. Chunks are sampled
+        contiguously from the first tick, so every lane generator yields the same sequence as in a Controller.
+        """
+        stop = start + self.chunk_seconds
+        rates = np.stack([arrivals.rates_between(start, stop) for arrivals in self.arrivals], axis=1)
+        size = (self.chunk_seconds, self.n_sim, self.n_lanes)
+        if self.lane_rngs is None:
+            self._arrival_counts = self.rng.poisson(rates[:, None, :] / 60, size=size).astype(np.int32)
+        else:
+            counts = np.empty(size, dtype=np.int32)
+            for r, lane_rngs in enumerate(self.lane_rngs):
+                for i, lane_rng in enumerate(lane_rngs):
+                    counts[:, r, i] = lane_rng.poisson(rates[:, i] / 60)
+            self._arrival_counts = counts
+        self._chunk_start = start
+
+    def num_new_cars(self) -> np.ndarray:
+        """
+        Returns the number of incoming cars pre-sampled for the current tick, of shape (n_sim, n_lanes).
+        """
+        t = self.clock.time
+        if not 0 <= t - self._chunk_start < len(self._arrival_counts):
+            self.sample_chunk(t)
+        return self._arrival_counts[t - self._chunk_start]
+
+    def update_new_active(self) -> None:
+        """
+        Appends the incoming cars of the current tick to the queues of every lane in every replicate.
+        """
+        t = self.clock.time
+        num_new_cars = self.num_new_cars()
+
+        max_new_cars = num_new_cars.max()
+        if max_new_cars == 0:
+            return
+
+        max_queue = (self.num_active_cars + num_new_cars).max()
+        if max_queue > self._capacity:
+            self._grow(max_queue)
+
+        tail = self._head + self.num_active_cars
+        for k in range(max_new_cars):
+            rep, lane = np.nonzero(num_new_cars > k)
+            self._arrival_times[rep, lane, (tail[rep, lane] + k) % self._capacity] = t
+
+        self.num_active_cars += num_new_cars
+
+    def drive_cars(self, rep: np.ndarray, lane: np.ndarray) -> None:
+        """
+        Moves the oldest car of each given (replicate, lane) pair out of its queue, accumulating its frustration.
+        """
+        t = self.clock.time
+        head = self._head[rep, lane]
+        waits = t - self._arrival_times[rep, lane, head].astype(np.float64)
+
+        self.passed_frustration[rep, lane] += self.frustration_fn(waits)
+        self.passed_waiting_time[rep, lane] += waits
+        self.max_passed_wait[rep, lane] = np.maximum(self.max_passed_wait[rep, lane], waits)
+        self._head[rep, lane] = (head + 1) % self._capacity
+        self.num_active_cars[rep, lane] -= 1
+        self.num_passed_cars[rep, lane] += 1
+        self.last_exit_time[rep, lane] = t
+
+    def run_next_lane(self, rep: np.ndarray) -> None:
+        """
+        Switches the given replicates to their next lane in a circular manner.
+        """
+        t = self.clock.time
+        lane = self.active_lane_num[rep]
+        self.last_active_time[rep, lane] = t
+
+        lane = (lane + 1) % self.n_lanes
+        self.active_lane_num[rep] = lane
+        self.active_since[rep, lane] = t
+
+    def run_iter(self) -> None:
+        """
+        Advances every replicate by one tick, following the same steps as Controller.run_iter.
+        """
+        self.clock.tick()
+
+        self.update_new_active()
+
+        time_since_last_exit = self.clock.time - self.active_lane_last_exit_time
+        can_exit = (self.active_lane_num_cars > 0) & (time_since_last_exit >= (1 / self.exit_rate))
+        rep = self.replicates[can_exit]
+        self.drive_cars(rep, self.active_lane_num[rep])
+
+        is_time_up = self.strategy.is_time_up_batch(self, **self.strategy_kwargs)
+        self.run_next_lane(self.replicates[is_time_up])
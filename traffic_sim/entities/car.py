@@ -7,10 +7,14 @@ class Car:
     def __init__(
             self,
             frustration_fn: Callable,
-            clock: Clock
+            clock: Clock,
+            arrival_time: int = None,
+            exit_time: int = None,
     ):
         """
         Initializes a Car instance with the given frustration function and clock.
+        Lanes store their cars as arrays of timestamps and create Car instances as views on demand,
+        passing the stored arrival and exit times.
 
         Parameters:
         -----------
@@ -20,6 +24,10 @@ class Car:
             The function that calculates the frustration of the car.
         clock: Clock
             The clock instance used to track time.
+        arrival_time: int, optional
+            The time the car arrived. Defaults to the current time of the clock.
+        exit_time: int, optional
+            The time the car exited, if it already did.
 
         Returns:
         --------
@@ -28,8 +36,8 @@ class Car:
         self.clock = clock
         self.frustration_fn = frustration_fn
 
-        self.arrival_time = self.clock.time
-        self.exit_time = None
+        self.arrival_time = self.clock.time if arrival_time is None else arrival_time
+        self.exit_time = exit_time
 
     @property
     def frustration(self) -> float:
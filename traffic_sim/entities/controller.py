@@ -1,9 +1,19 @@
 from abc import ABC, abstractmethod
+from contextlib import nullcontext
+import heapq
+import math
+import time
+
+import numpy as np
 from traffic_sim.entities.lane import Lane
-from traffic_sim.utils import Clock
+from traffic_sim.entities.history import HistoryRecorder
+from traffic_sim.utils import Clock, PhaseProfiler
 from typing import List, Callable
 
 
+_NO_SPAN = nullcontext()
+
+
 class Controller(ABC):
 
     def __init__(
@@ -12,6 +22,12 @@ class Controller(ABC):
             exit_rate: int,
             frustration_fn: Callable,
             save_hist: bool = False,
+            rng: np.random.Generator = None,
+            hist_every: int = 1,
+            hist_seconds: int = 24 * 60 * 60,
+            hist_path: str = None,
+            profile: bool = False,
+            warm_start: 'Controller' = None,
     ):
         """
         Initializes the Controller object with the provided lanes configuration, exit rate, frustration function,
@@ -26,29 +42,62 @@ class Controller(ABC):
         frustration_fn : Callable
             A function that calculates the frustration level of cars in the lanes.
         save_hist : bool, optional
-            A flag indicating whether to save the history of the controller's state.
-            Defaults to False.
+            A flag indicating whether to save the history of the controller's state. The history arrays are only
+            allocated when set. Defaults to False.
+        rng : np.random.Generator, optional
+            The random generator of this simulation. Every lane draws from its own child generator spawned from it,
+            so that arrivals do not depend on the order in which lanes are sampled. Defaults to a freshly seeded one.
+        hist_every : int, optional
+            Record the history once every hist_every seconds. Defaults to 1.
+        hist_seconds : int, optional
+            Expected duration of the simulation in seconds, used to preallocate the history. Defaults to a day.
+        hist_path : str, optional
+            Stream the history to this directory of .npy files, or .parquet file, instead of keeping it in memory.
+            Defaults to None.
+        profile : bool, optional
+            Whether to accumulate the wall-clock time of every phase of run_iter in self.profiler. Defaults to False,
+            in which case run_iter is not instrumented at all.
+        warm_start : Controller, optional
+            A controller, e.g. restored from a checkpoint, whose clock, lanes (with their queued cars and random
+            generators) and active lane are taken over instead of starting from an empty junction at time 0. Its
+            strategy may differ. lanes_config is then ignored. Defaults to None.
         """
         self.clock = Clock()
         self.exit_rate = exit_rate
 
-        self.n_lanes = len(lanes_config)
-        self.lanes = [
-            Lane(clock=self.clock, frustration_fn=frustration_fn, **lane_config)
-            for lane_config in lanes_config
-        ]
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.profiler = PhaseProfiler() if profile else None
 
-        self.active_lane_num = -1
-        self.active_lane = self.lanes[self.active_lane_num]
-        self.t = 0
+        if warm_start is not None:
+            self.clock = warm_start.clock
+            self.n_lanes = warm_start.n_lanes
+            self.lanes = warm_start.lanes
+            self.active_lane_num = warm_start.active_lane_num
+            self.active_lane = warm_start.active_lane
+            self.t = self.clock.time
+        else:
+            self.n_lanes = len(lanes_config)
+            self.lanes = [
+                Lane(clock=self.clock, frustration_fn=frustration_fn, rng=lane_rng, **lane_config)
+                for lane_config, lane_rng in zip(lanes_config, self.rng.spawn(self.n_lanes))
+            ]
+
+            self.active_lane_num = -1
+            self.active_lane = self.lanes[self.active_lane_num]
+            self.t = 0
 
-        self.run_next_lane()
+            self.run_next_lane()
 
         self.save_hist = save_hist
-        self.state_hist = {
-            'lane_activity': {i: [] for i in range(self.n_lanes)},
-            'active_light': []
-        }
+        self.hist = None
+        if save_hist:
+            self.hist = HistoryRecorder(seconds=hist_seconds, every=hist_every, path=hist_path)
+            self.hist.add_series('lane_activity', n_cols=self.n_lanes)
+            self.hist.add_series('active_light', run_length=True)
+
+    @property
+    def state_hist(self) -> dict | None:
+        return None if self.hist is None else self.hist.to_dict()
 
     @property
     def num_active(self) -> int:
@@ -89,30 +138,231 @@ class Controller(ABC):
         """
         Updates the controller state for each iteration by ticking the clock,
         updating active lanes with new cars, driving cars if conditions are met,
-        and triggering lane switches based on time and conditions.
+        and triggering lane switches based on time and conditions. When profiling, every phase is timed into
+        self.profiler.
         """
         self.clock.tick()
 
+        with self.span('arrivals'):
+            self.update_arrivals()
+
+        with self.span('departures'):
+            self.update_departures()
+
+        with self.span('decision'):
+            self.update_lights()
+
+        if self.save_hist:
+            with self.span('hist'):
+                self.update_hist()
+
+    def update_arrivals(self) -> None:
+        """
+        Adds the cars arriving at the current tick to every lane.
+        """
         for lane in self.lanes:
             lane.update_new_active()
 
+    def update_departures(self) -> None:
+        """
+        Drives the first car of the active lane through the junction if one is waiting and the exit rate allows it.
+        """
         num_active_cars = self.active_lane.num_active_cars
         time_since_last_exit = self.clock.time - self.active_lane.last_exit_time
 
         if num_active_cars > 0 and time_since_last_exit >= (1 / self.exit_rate):
             self.active_lane.drive_car()
 
+    def update_lights(self) -> None:
+        """
+        Switches to the next lane if the strategy decides that the active lane's time is up.
+        """
         if self.is_time_up():
             self.run_next_lane()
 
-        if self.save_hist:
-            self.update_hist()
+    def span(self, name: str):
+        """
+        Returns a context manager timing the enclosed block as the phase name, or doing nothing when profiling is
+        disabled. Strategies use it to time their own expensive steps.
+        """
+        return self.profiler.span(name) if self.profiler is not None else _NO_SPAN
 
     @abstractmethod
     def is_time_up(self) -> bool:
         raise NotImplementedError('Must create a subclass and implement is_time_up method containing the AI.')
 
-    def update_hist(self):
-        for i in range(self.n_lanes):
-            self.state_hist['lane_activity'][i].append(self.lanes[i].num_active_cars)
-            self.state_hist['active_light'].append(self.active_lane_num)
+    def next_decision_time(self) -> float:
+        """
+        Returns the earliest time at which is_time_up may return True, assuming no car arrives or exits before then.
+        Strategies override this to let run_until jump over idle seconds. The default polls every tick, so
+        strategies which only implement is_time_up keep working unchanged.
+
+        Returns:
+        -------
+        float: The time of the next decision.
+        """
+        return self.clock.time + self.clock.step
+
+    def first_tick_after(self, t: float) -> float:
+        """
+        Returns the first clock tick strictly after time t, but no earlier than the next tick.
+        """
+        next_tick = self.clock.time + self.clock.step
+        if t == -np.inf:
+            return next_tick
+        return max(next_tick, (math.floor(t / self.clock.step) + 1) * self.clock.step)
+
+    def next_exit_time(self) -> float:
+        """
+        Returns the earliest time at which a car may exit the active lane, assuming no switch happens before then.
+
+        Returns:
+        -------
+        float: The time of the next exit, or np.inf if the active lane is empty.
+        """
+        if self.active_lane.num_active_cars == 0:
+            return np.inf
+        return max(self.clock.time + self.clock.step, self.active_lane.last_exit_time + math.ceil(1 / self.exit_rate))
+
+    def skip_to(self, t: int) -> None:
+        """
+        Advances the clock to time t, given that no car arrives or exits and no decision is due before then.
+
+        Parameters
+        ----------
+        t : int
+            The time to advance to.
+        """
+        if t <= self.clock.time:
+            return
+
+        repeat = (t - self.clock.time) // self.clock.step
+        self.clock.time = t
+        if self.save_hist:
+            self.update_hist(repeat=repeat)
+
+    def run_until(self, end_time: int) -> None:
+        """
+        Advances the controller to end_time, processing only the ticks at which something happens.
+
+        The next arrival of every lane is kept in a priority queue. The next event is the earliest of that arrival,
+        the next exit of the active lane and the strategy's next decision time. The clock jumps to the tick just
+        before it, and run_iter processes the event tick exactly as in tick-by-tick simulation. When profiling, the
+        time spent outside run_iter is accumulated as the 'schedule' phase.
+
+        Parameters
+        ----------
+        end_time : int
+            The time at which to stop.
+        """
+        arrivals = [(lane.next_arrival_time(end_time), i) for i, lane in enumerate(self.lanes)]
+        heapq.heapify(arrivals)
+        profiler = self.profiler
+
+        while self.clock.time < end_time:
+            if profiler is not None:
+                tick = time.perf_counter()
+
+            next_time = min(arrivals[0][0], self.next_exit_time(), self.next_decision_time(), end_time)
+            self.skip_to(next_time - self.clock.step)
+
+            if profiler is not None:
+                profiler.add('schedule', time.perf_counter() - tick)
+
+            self.run_iter()
+
+            if profiler is not None:
+                tick = time.perf_counter()
+
+            while arrivals[0][0] <= self.clock.time:
+                _, i = heapq.heappop(arrivals)
+                heapq.heappush(arrivals, (self.lanes[i].next_arrival_time(end_time), i))
+
+            if profiler is not None:
+                profiler.add('schedule', time.perf_counter() - tick, calls=0)
+
+    def run_step(self, max_step: int, adaptive: bool = True) -> None:
+        """
+        Advances the controller by up to max_step ticks at once.
+
+        The arrivals of the whole step are added with their exact arrival times, and the active lane releases a car
+        at every exit slot, i.e. every ceil(1 / exit_rate) seconds, at which one is waiting, each with its exact exit
+        time. The strategy is only consulted at the last tick of the step. When adaptive, the step ends at the
+        strategy's next decision time, re-evaluated whenever the active lane runs empty, so that lanes switch at the
+        same tick as in tick-by-tick simulation. The history holds the state at the end of the step for all of its
+        ticks.
+
+        Parameters
+        ----------
+        max_step : int
+            The longest step, in ticks.
+        adaptive : bool, optional
+            Whether to end the step at the strategy's next decision time, by default True. Otherwise decisions are
+            only taken every max_step ticks.
+        """
+        step = self.clock.step
+        start = self.clock.time
+        end = start + max_step * step
+        if adaptive:
+            decision_time = self.next_decision_time()
+            if decision_time == np.inf:
+                # e.g. IdleController rotating over empty lanes, which only skip_to knows how to fast-forward
+                next_arrival = min(lane.next_arrival_time(end) for lane in self.lanes)
+                self.skip_to(min(next_arrival, end) - step)
+                start = self.clock.time
+                decision_time = start + step
+            end = min(end, max(decision_time, start + step))
+
+        lane = self.active_lane
+        gap = math.ceil(1 / self.exit_rate)
+        exit_time = max(start + step, lane.last_exit_time + gap)
+        arrival = lane.arrivals.next_arrival_time(start + step, end + 1)
+        while True:
+            if lane.num_active_cars == 0:
+                if adaptive:
+                    # the lane stays empty until the next arrival, which may bring a decision forward
+                    decision_time = self.next_decision_time()
+                    if decision_time < arrival and decision_time < end:
+                        end = decision_time
+                exit_time = max(exit_time, arrival)
+            if exit_time > end:
+                break
+            while arrival <= exit_time:
+                lane.add_arrivals(arrival)
+                arrival = lane.arrivals.next_arrival_time(arrival + step, end + 1)
+            self.clock.time = exit_time
+            lane.drive_car()
+            exit_time += gap
+
+        while arrival <= end:
+            lane.add_arrivals(arrival)
+            arrival = lane.arrivals.next_arrival_time(arrival + step, end + 1)
+        for other in self.lanes:
+            if other is not lane:
+                other.update_new_active_between(start + step, end)
+
+        self.clock.time = end
+        if self.is_time_up():
+            self.run_next_lane()
+
+        if self.save_hist:
+            self.update_hist(repeat=(end - start) // step)
+
+    def hist_values(self) -> dict:
+        """
+        Returns the current value of every series declared in the history. Strategies recording additional series
+        extend this.
+        """
+        return {
+            'lane_activity': [lane.num_active_cars for lane in self.lanes],
+            'active_light': self.active_lane_num,
+        }
+
+    def update_hist(self, repeat: int = 1):
+        """
+        Records the current state for the last repeat ticks, during which it did not change. Does nothing unless the
+        controller was created with save_hist.
+        """
+        if self.hist is None:
+            return
+        self.hist.record(self.hist_values(), self.clock.time, repeat)
@@ -0,0 +1,415 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+_NPY_HEADER_LEN = 128
+
+
+def _npy_header(dtype: np.dtype, length: int) -> bytes:
+    """
+    Returns a version 1.0 .npy header of a fixed size, so that it can be rewritten in place as rows are appended.
+    """
+    header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (length,)})
+    header = header.ljust(_NPY_HEADER_LEN - 10 - 1) + '\n'
+    return np.lib.format.MAGIC_PREFIX + bytes([1, 0]) + len(header).to_bytes(2, 'little') + header.encode('latin1')
+
+
+class NpyHistorySink:
+    """
+    Streams history columns to a directory holding one appendable .npy file per column.
+
+    Parameters
+    ----------
+    path : str | Path
+        The directory of the replicate's history.
+    columns : dict
+        Mapping of each column name to its dtype.
+    meta : dict
+        Layout of the history, written to meta.json so that load_history can rebuild Controller.state_hist.
+    append : bool, optional
+        Whether to keep appending to the files already at path, e.g. after restoring a pickled recorder.
+    """
+
+    def __init__(self, path: str | Path, columns: dict, meta: dict, append: bool = False):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path / 'meta.json').write_text(json.dumps(meta))
+
+        self.dtypes = {name: np.dtype(dtype) for name, dtype in columns.items()}
+        self.length = 0
+        self._files = {}
+        for name, dtype in self.dtypes.items():
+            if append:
+                self.length = len(np.load(self.path / f'{name}.npy', mmap_mode='r'))
+                f = open(self.path / f'{name}.npy', 'r+b')
+            else:
+                f = open(self.path / f'{name}.npy', 'wb')
+                f.write(_npy_header(dtype, 0))
+            self._files[name] = f
+
+    def write(self, chunk: dict) -> None:
+        """
+        Appends a chunk of rows, given as one array per column, and updates the headers so that the files can be
+        memory mapped at any time.
+        """
+        n = None
+        for name, f in self._files.items():
+            values = np.ascontiguousarray(chunk[name], dtype=self.dtypes[name])
+            n = len(values)
+            f.seek(0, 2)
+            f.write(values.tobytes())
+            f.seek(0)
+            f.write(_npy_header(self.dtypes[name], self.length + n))
+            f.flush()
+        self.length += n or 0
+
+    def close(self) -> None:
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+
+class ParquetHistorySink:
+    """
+    Streams history columns to a single Parquet file, one row group per chunk. Requires pyarrow.
+
+    Parameters
+    ----------
+    path : str | Path
+        The .parquet file of the replicate's history.
+    columns : dict
+        Mapping of each column name to its dtype.
+    meta : dict
+        Layout of the history, stored in the schema metadata.
+    """
+
+    def __init__(self, path: str | Path, columns: dict, meta: dict, append: bool = False):
+        if pa is None:
+            raise ImportError('Writing history to Parquet requires pyarrow.')
+        if append:
+            raise ValueError('Parquet histories cannot be appended to once closed.')
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        schema = pa.schema(
+            [(name, pa.from_numpy_dtype(np.dtype(dtype))) for name, dtype in columns.items()],
+            metadata={'traffic_sim': json.dumps(meta)},
+        )
+        self.length = 0
+        self._writer = pq.ParquetWriter(self.path, schema)
+
+    def write(self, chunk: dict) -> None:
+        table = pa.table(chunk, schema=self._writer.schema)
+        self._writer.write_table(table)
+        self.length += table.num_rows
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+def open_history_sink(
+        path: str | Path,
+        columns: dict,
+        meta: dict,
+        append: bool = False,
+) -> NpyHistorySink | ParquetHistorySink:
+    """
+    Opens a ParquetHistorySink if path ends in .parquet, and a NpyHistorySink directory otherwise.
+    """
+    if str(path).endswith('.parquet'):
+        return ParquetHistorySink(path, columns, meta, append=append)
+    return NpyHistorySink(path, columns, meta, append=append)
+
+
+def load_history(path: str | Path) -> dict:
+    """
+    Lazily loads a streamed history in the layout of Controller.state_hist.
+
+    The columns of a .npy directory are memory mapped, so only the pages which are read are loaded. The columns
+    of a Parquet file are read through a memory map as well, and are converted to numpy without copying.
+
+    Parameters
+    ----------
+    path : str | Path
+        The history directory, or .parquet file, written by a HistoryRecorder.
+
+    Returns
+    -------
+    dict
+        Every series, with the columns of multi-column series under {i: column}.
+    """
+    path = Path(path)
+    if path.suffix == '.parquet':
+        if pq is None:
+            raise ImportError('Reading history from Parquet requires pyarrow.')
+        table = pq.read_table(path, memory_map=True)
+        meta = json.loads(table.schema.metadata[b'traffic_sim'])
+        columns = {name: table.column(name).to_numpy() for name in table.column_names}
+    else:
+        meta = json.loads((path / 'meta.json').read_text())
+        columns = {name: np.load(path / f'{name}.npy', mmap_mode='r') for name in meta['columns']}
+
+    hist = {}
+    for name, n_cols in meta['series'].items():
+        if n_cols is None:
+            hist[name] = columns[name]
+        else:
+            hist[name] = {i: columns[f'{name}_{i}'] for i in range(n_cols)}
+    return hist
+
+
+class HistoryRecorder:
+    """
+    Class recording the history of a simulation into preallocated numpy arrays.
+
+    Parameters
+    ----------
+    seconds : int
+        Expected duration of the simulation in seconds, used to preallocate the arrays.
+    every : int
+        Record one sample every `every` ticks, starting from the first tick.
+    path : str | Path, optional
+        Stream the history to this directory of .npy files, or .parquet file, instead of keeping it in memory.
+    chunk_size : int
+        Number of samples buffered in memory between two writes to path.
+
+    Attributes
+    ----------
+    num_samples : int
+        Number of samples recorded so far.
+
+    Methods
+    -------
+    add_series(name, dtype, n_cols, run_length) -> None
+        Declares a series to be recorded.
+    record(values, t, n_ticks) -> None
+        Records the values of every series for the last n_ticks ticks ending at time t.
+    runs(name) -> tuple[np.ndarray, np.ndarray]
+        The sample index at which every run of a run-length encoded series starts, and its values.
+    series(name) -> np.ndarray
+        The recorded samples of a series.
+    to_dict() -> dict
+        All series in the layout of Controller.state_hist.
+    flush() -> None
+        Writes the buffered samples to path.
+    close() -> None
+        Flushes and closes the files at path.
+
+    Notes
+    -----
+    Dense series hold one row per sample. Slowly varying signals, such as the active light, can be stored as
+    run-length encoded series instead, which only keep a value when it changes.
+
+    When streaming to path, at most chunk_size samples are held in memory, so memory use does not grow with the
+    simulated duration. Run-length encoded series are expanded into dense columns on disk.
+    """
+
+    def __init__(
+            self,
+            seconds: int = 24 * 60 * 60,
+            every: int = 1,
+            path: str | Path = None,
+            chunk_size: int = 2 ** 16,
+    ):
+        self.every = every
+        self.path = path
+        self.num_samples = 0
+        self._capacity = seconds // every + 1
+        if path is not None:
+            self._capacity = min(self._capacity, chunk_size)
+
+        self._sink = None
+        self._num_flushed = 0
+
+        self._dense: dict[str, np.ndarray] = {}
+        self._n_cols: dict[str, int] = {}
+        self._run_starts: dict[str, list[int]] = {}
+        self._run_values: dict[str, list] = {}
+        self._run_dtypes: dict[str, type] = {}
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        if self.path is None:
+            state['_dense'] = {name: data[:self.num_samples] for name, data in self._dense.items()}
+            state['_capacity'] = self.num_samples
+        state['_sink'] = None
+        return state
+
+    def add_series(self, name: str, dtype: type = np.int32, n_cols: int = None, run_length: bool = False) -> None:
+        """
+        Declares a series to be recorded.
+
+        Parameters
+        ----------
+        name : str
+            Name of the series.
+        dtype : type, optional
+            Numpy dtype of the recorded values, by default np.int32.
+        n_cols : int, optional
+            Number of values recorded per sample for dense series, by default a single scalar.
+        run_length : bool, optional
+            Whether to store only the changes of the series, by default False.
+        """
+        if run_length:
+            self._run_starts[name] = []
+            self._run_values[name] = []
+            self._run_dtypes[name] = dtype
+        else:
+            shape = (self._capacity,) if n_cols is None else (self._capacity, n_cols)
+            self._dense[name] = np.zeros(shape, dtype=dtype)
+            self._n_cols[name] = n_cols
+
+    def num_sampled(self, t: int, n_ticks: int = 1) -> int:
+        """
+        Returns how many of the last n_ticks ticks ending at time t are sampled.
+        Ticks start at time 1, and the sampled ones are 1, 1 + every, 1 + 2 * every, ...
+        """
+        first = t - n_ticks + 1
+        return (t - 1) // self.every - (first - 2) // self.every
+
+    def _grow(self, min_capacity: int) -> None:
+        self._capacity = max(2 * self._capacity, min_capacity)
+        for name, data in self._dense.items():
+            grown = np.zeros((self._capacity,) + data.shape[1:], dtype=data.dtype)
+            grown[:len(data)] = data
+            self._dense[name] = grown
+
+    def record(self, values: dict, t: int, n_ticks: int = 1) -> None:
+        """
+        Records the values of every series for the last n_ticks ticks ending at time t, during which they were
+        constant.
+
+        Parameters
+        ----------
+        values : dict
+            Mapping of each declared series to its current value.
+        t : int
+            The current time.
+        n_ticks : int, optional
+            Number of ticks the values held for, by default 1.
+        """
+        n = self.num_sampled(t, n_ticks)
+        if n <= 0:
+            return
+
+        for name, run_values in self._run_values.items():
+            value = values[name]
+            if not run_values or run_values[-1] != value:
+                self._run_starts[name].append(self.num_samples)
+                run_values.append(value)
+
+        while n > 0:
+            start = self.num_samples - self._num_flushed
+            if self.path is None and start + n > self._capacity:
+                self._grow(start + n)
+            elif start == self._capacity:
+                self.flush()
+                start = 0
+
+            m = min(n, self._capacity - start)
+            for name, data in self._dense.items():
+                data[start:start + m] = values[name]
+            self.num_samples += m
+            n -= m
+
+    def runs(self, name: str) -> tuple[np.ndarray, np.ndarray]:
+        return np.array(self._run_starts[name], dtype=np.int64), np.array(self._run_values[name])
+
+    def _expand_runs(self, name: str, start: int, stop: int) -> np.ndarray:
+        starts, values = self.runs(name)
+        idx = np.searchsorted(starts, np.arange(start, stop), side='right') - 1
+        return values[idx].astype(self._run_dtypes[name])
+
+    def series(self, name: str) -> np.ndarray:
+        if self.path is not None:
+            return self._column_data(self.to_dict()[name])
+
+        if name in self._dense:
+            return self._dense[name][:self.num_samples]
+        return self._expand_runs(name, 0, self.num_samples)
+
+    @staticmethod
+    def _column_data(data: dict | np.ndarray) -> np.ndarray:
+        if isinstance(data, dict):
+            return np.column_stack([data[i] for i in range(len(data))])
+        return data
+
+    def _columns(self) -> dict:
+        columns = {}
+        for name, data in self._dense.items():
+            n_cols = self._n_cols[name]
+            if n_cols is None:
+                columns[name] = data.dtype
+            else:
+                columns.update({f'{name}_{i}': data.dtype for i in range(n_cols)})
+        for name, dtype in self._run_dtypes.items():
+            columns[name] = dtype
+        return columns
+
+    def flush(self) -> None:
+        """
+        Writes the buffered samples to path and empties the buffer. Run-length encoded series only keep their
+        last run, which may still be extended.
+        """
+        if self.path is None:
+            return
+
+        n = self.num_samples - self._num_flushed
+        if self._sink is None and (n > 0 or self._num_flushed == 0):
+            columns = self._columns()
+            meta = {
+                'every': self.every,
+                'columns': list(columns),
+                'series': {name: self._n_cols.get(name) for name in list(self._dense) + list(self._run_values)},
+            }
+            self._sink = open_history_sink(self.path, columns, meta, append=self._num_flushed > 0)
+
+        if n == 0:
+            return
+
+        chunk = {}
+        for name, data in self._dense.items():
+            n_cols = self._n_cols[name]
+            if n_cols is None:
+                chunk[name] = data[:n]
+            else:
+                chunk.update({f'{name}_{i}': data[:n, i] for i in range(n_cols)})
+        for name in self._run_values:
+            chunk[name] = self._expand_runs(name, self._num_flushed, self.num_samples)
+            del self._run_starts[name][:-1]
+            del self._run_values[name][:-1]
+
+        self._sink.write(chunk)
+        self._num_flushed = self.num_samples
+
+    def close(self) -> None:
+        """
+        Flushes the buffered samples and closes the files at path.
+        """
+        if self.path is None:
+            return
+        self.flush()
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+
+    def to_dict(self) -> dict:
+        if self.path is not None:
+            self.flush()
+            return load_history(self.path)
+
+        hist = {}
+        for name in list(self._dense) + list(self._run_values):
+            data = self.series(name)
+            if self._n_cols.get(name) is not None:
+                hist[name] = {i: data[:, i] for i in range(data.shape[1])}
+            else:
+                hist[name] = data
+        return hist
@@ -1,14 +1,24 @@
-from collections import deque
+from math import comb
 
 import numpy as np
 from traffic_sim.utils import Clock
 from traffic_sim.entities.car import Car
+from traffic_sim.entities.arrivals import PoissonArrivals
+from traffic_sim.entities.arrival_counter import ArrivalCounter
+from traffic_sim.entities.time_buffer import TimeBuffer
 from typing import Callable
 
 
 class Lane:
 
-    def __init__(self, clock: Clock, traffic_rate_fn: Callable, frustration_fn: Callable):
+    def __init__(
+            self,
+            clock: Clock,
+            traffic_rate_fn: Callable,
+            frustration_fn: Callable,
+            arrivals: PoissonArrivals = None,
+            rng: np.random.Generator = None,
+    ):
         """
         Initializes a Lane object with the provided clock, traffic rate function, and frustration function.
 
@@ -20,6 +30,10 @@ class Lane:
             The function that calculates the current traffic rate.
         frustration_fn: Callable
             The function that determines the frustration level of cars in the lane.
+        arrivals: PoissonArrivals, optional
+            The source of incoming cars. Defaults to Poisson arrivals pre-sampled from traffic_rate_fn.
+        rng: np.random.Generator, optional
+            The random generator used by the default arrivals source.
 
         Returns:
         --------
@@ -31,12 +45,23 @@ class Lane:
         self.last_exit_time = -np.inf
 
         self.traffic_rate_fn = traffic_rate_fn
+        self.arrivals = PoissonArrivals(traffic_rate_fn, rng=rng) if arrivals is None else arrivals
+        self.arrival_counter = ArrivalCounter(clock)
 
-        self.active: deque[Car] = deque()
-        self.passed: deque[Car] = deque()
+        self.active_arrival_times = TimeBuffer()
+        self.passed_arrival_times = TimeBuffer()
+        self.passed_exit_times = TimeBuffer()
 
         self.frustration_fn = frustration_fn
 
+        # running totals so that frustration and waiting time queries do not re-sum every car.
+        # frustration functions exposing poly_coefs get their active frustration from power sums of arrival times.
+        self.poly_coefs = getattr(frustration_fn, 'poly_coefs', None)
+        degree = max(1, len(self.poly_coefs) - 1) if self.poly_coefs is not None else 1
+        self._active_power_sums = [0] * (degree + 1)
+        self._passed_frustration = 0.
+        self._passed_waiting_time = 0
+
     def set_green(self) -> None:
         self.active_since = self.clock.time
 
@@ -47,33 +72,100 @@ class Lane:
     def entry_rate(self) -> int:
         return self.traffic_rate_fn(self.clock.time / 60 / 60)
 
+    @property
+    def active(self) -> list[Car]:
+        """
+        Car views of the waiting cars, ordered from the most recent arrival to the oldest.
+        """
+        return [
+            Car(frustration_fn=self.frustration_fn, clock=self.clock, arrival_time=int(arrival_time))
+            for arrival_time in self.active_arrival_times.to_array()[::-1]
+        ]
+
+    @property
+    def passed(self) -> list[Car]:
+        """
+        Car views of the cars which exited the lane, ordered from the most recent exit to the oldest.
+        """
+        return [
+            Car(
+                frustration_fn=self.frustration_fn,
+                clock=self.clock,
+                arrival_time=int(arrival_time),
+                exit_time=int(exit_time),
+            )
+            for arrival_time, exit_time in zip(
+                self.passed_arrival_times.to_array()[::-1],
+                self.passed_exit_times.to_array()[::-1],
+            )
+        ]
+
     @property
     def num_active_cars(self) -> int:
-        return len(self.active)
+        return len(self.active_arrival_times)
 
     @property
     def num_passed_cars(self) -> int:
-        return len(self.passed)
+        return len(self.passed_arrival_times)
+
+    @property
+    def active_waits(self) -> np.ndarray:
+        return self.clock.time - self.active_arrival_times.to_array().astype(np.float64)
+
+    @property
+    def passed_waits(self) -> np.ndarray:
+        return (self.passed_exit_times.to_array() - self.passed_arrival_times.to_array()).astype(np.float64)
+
+    def active_wait_power_sum(self, k: int) -> int:
+        """
+        Calculates the sum of the k-th powers of the waiting times of the active cars in O(k) time.
+
+        Parameters:
+        -----------
+        k: int
+            The power, at most the degree of the maintained power sums.
+
+        Returns:
+        --------
+        int
+            The exact sum over active cars of (time - arrival_time) ** k.
+        """
+        t = self.clock.time
+        power_sums = self._active_power_sums
+        return sum(comb(k, j) * t ** (k - j) * (-1) ** j * power_sums[j] for j in range(k + 1))
 
     @property
     def active_frustration(self) -> float:
-        return sum(car.frustration for car in self.active)
+        if self.poly_coefs is None:
+            return float(np.sum(self.frustration_fn(self.active_waits)))
+        return float(sum(coef * self.active_wait_power_sum(k) for k, coef in enumerate(self.poly_coefs) if coef))
 
     @property
     def active_waiting_time(self) -> float:
-        return sum(car.wait for car in self.active)
+        return self.active_wait_power_sum(1)
 
     @property
     def passed_frustration(self) -> float:
-        return sum(car.frustration for car in self.passed)
+        return self._passed_frustration
+
+    @property
+    def passed_waiting_time(self) -> float:
+        return self._passed_waiting_time
 
     @property
     def total_frustration(self) -> float:
         return self.active_frustration + self.passed_frustration
 
+    def add_rate_window(self, lookback: int) -> None:
+        """
+        Registers a lookback window of the arrival counter, counting the cars which already arrived in the lane.
+        """
+        arrival_times = np.concatenate([self.passed_arrival_times.to_array(), self.active_arrival_times.to_array()])
+        self.arrival_counter.add_window(lookback, arrival_times)
+
     def update_new_active(self) -> None:
         """
-        Updates the active cars in the lane based on the current traffic rate.
+        Updates the active cars in the lane with the arrivals pre-sampled for the current time.
 
         Parameters:
         -----------
@@ -84,16 +176,37 @@ class Lane:
         --------
         None
         """
-        current_rate = self.traffic_rate_fn(self.clock.time / 60 / 60)
+        self._add_arrivals(self.clock.time, self.arrivals.num_arrivals(self.clock.time))
 
-        num_new_cars = int(np.random.poisson(current_rate / 60))
+    def update_new_active_between(self, start: int, stop: int) -> None:
+        """
+        Adds every car arriving from time start up to time stop at once, each with its exact arrival time. The clock
+        is not moved.
+        """
+        t = self.arrivals.next_arrival_time(start, stop + 1)
+        while t <= stop:
+            self.add_arrivals(t)
+            t = self.arrivals.next_arrival_time(t + self.clock.step, stop + 1)
 
-        for _ in range(num_new_cars):
-            car = Car(
-                frustration_fn=self.frustration_fn,
-                clock=self.clock,
-            )
-            self.active.appendleft(car)
+    def add_arrivals(self, t: int) -> None:
+        """
+        Adds the cars arriving at time t.
+        """
+        self._add_arrivals(t, self.arrivals.num_arrivals(t))
+
+    def _add_arrivals(self, t: int, num_new_cars: int) -> None:
+        self.arrival_counter.record(num_new_cars, t)
+
+        self.active_arrival_times.append(t, num_new_cars)
+        for k in range(len(self._active_power_sums)):
+            self._active_power_sums[k] += num_new_cars * t ** k
+
+    def next_arrival_time(self, until: float = np.inf) -> float:
+        """
+        Returns the first time after the current one at which a car arrives in the lane, or np.inf if none
+        does before until.
+        """
+        return self.arrivals.next_arrival_time(self.clock.time + self.clock.step, until)
 
     def drive_car(self) -> None:
         """
@@ -102,7 +215,14 @@ class Lane:
         if self.num_active_cars == 0:
             return
 
-        exit_car = self.active.pop()
-        exit_car.exit_time = self.clock.time
-        self.passed.appendleft(exit_car)
+        arrival_time = self.active_arrival_times.popleft()
+        for k in range(len(self._active_power_sums)):
+            self._active_power_sums[k] -= arrival_time ** k
+
+        wait = self.clock.time - arrival_time
+        self._passed_frustration += self.frustration_fn(wait)
+        self._passed_waiting_time += wait
+
+        self.passed_arrival_times.append(arrival_time)
+        self.passed_exit_times.append(self.clock.time)
         self.last_exit_time = self.clock.time
@@ -0,0 +1,203 @@
+import numpy as np
+from traffic_sim.entities.arrivals import PoissonArrivals
+from traffic_sim.entities.batch_controller import BatchController, check_batch_lanes
+from typing import List, Callable
+
+
+class NetworkController(BatchController):
+
+    def __init__(
+            self,
+            strategy: type,
+            junctions: List[List[dict]],
+            routes: List[dict],
+            exit_rate: int,
+            frustration_fn: Callable,
+            rng: np.random.Generator = None,
+            **strategy_kwargs
+    ):
+        """
+        Initializes a NetworkController, advancing a road network of junctions at once. Every junction is a row of
+        the underlying BatchController state, so that all junctions are stepped together by array operations.
+
+        Cars driven out of a lane are routed according to its turning ratios: each one either joins a lane of a
+        downstream junction after a travel delay, or leaves the network.
+
+        Parameters
+        ----------
+        strategy : type
+            The Controller subclass whose switching rule is applied at every junction. It must implement the static
+            method is_time_up_batch(batch, **strategy_kwargs).
+        junctions : List[List[dict]]
+            The lanes_config of every junction. All junctions must have the same number of lanes. A lane whose
+            traffic_rate_fn is None only receives cars routed from upstream.
+        routes : List[dict]
+            The turning ratios of the network. Each route is a dictionary with keys 'from' and 'to', both
+            (junction, lane) pairs, 'p', the proportion of the cars leaving 'from' which take this route, and
+            'delay', the travel time in seconds (at least 1). Cars which take no route leave the network.
+        exit_rate : int
+            The rate at which cars exit the lanes.
+        frustration_fn : Callable
+            A function that calculates the frustration level of cars in the lanes. Must accept numpy arrays.
+        rng : np.random.Generator, optional
+            The random generator to sample arrivals and turns from. Defaults to a freshly seeded one.
+        **strategy_kwargs
+            Keyword arguments forwarded to the strategy's is_time_up_batch. Arrays of shape (n_junctions,) give
+            every junction its own setting.
+        """
+        n_lanes = {len(lanes_config) for lanes_config in junctions}
+        if len(n_lanes) != 1:
+            raise ValueError('All junctions must have the same number of lanes.')
+        for lanes_config in junctions:
+            check_batch_lanes(lanes_config)
+
+        super().__init__(
+            strategy=strategy,
+            n_sim=len(junctions),
+            lanes_config=junctions[0],
+            exit_rate=exit_rate,
+            frustration_fn=frustration_fn,
+            rng=rng,
+            **strategy_kwargs
+        )
+        self.n_junctions = self.n_sim
+        self.junction_arrivals = [
+            [
+                None if lane_config.get('traffic_rate_fn') is None else PoissonArrivals(lane_config['traffic_rate_fn'])
+                for lane_config in lanes_config
+            ]
+            for lanes_config in junctions
+        ]
+
+        self._build_routes(routes)
+        self.num_left_network = 0
+
+    def _build_routes(self, routes: List[dict]) -> None:
+        """
+        Tabulates the routes leaving every (junction, lane) as rows of cumulative probabilities, destinations and
+        delays, so that the turns of all exiting cars are sampled at once.
+        """
+        shape = (self.n_junctions, self.n_lanes)
+        branches = [[[] for _ in range(self.n_lanes)] for _ in range(self.n_junctions)]
+        for route in routes:
+            (j, i), (to_j, to_i) = route['from'], route['to']
+            if route['delay'] < 1:
+                raise ValueError(f'Route from {route["from"]} to {route["to"]} must take at least one second.')
+            branches[j][i].append((route['p'], np.ravel_multi_index((to_j, to_i), shape), int(route['delay'])))
+
+        n_branches = max([len(b) for row in branches for b in row] + [1])
+        self._route_cum_p = np.ones(shape + (n_branches,))
+        self._route_dest = np.full(shape + (n_branches,), -1, dtype=np.int64)
+        self._route_delay = np.zeros(shape + (n_branches,), dtype=np.int64)
+        for j, row in enumerate(branches):
+            for i, lane_branches in enumerate(row):
+                if not lane_branches:
+                    continue
+                p, dest, delay = zip(*lane_branches)
+                cum_p = np.cumsum(p)
+                if cum_p[-1] > 1 + 1e-9:
+                    raise ValueError(f'Turning ratios leaving {(j, i)} add up to more than 1.')
+                k = len(lane_branches)
+                self._route_cum_p[j, i, :k] = cum_p
+                self._route_dest[j, i, :k] = dest
+                self._route_delay[j, i, :k] = delay
+
+        # cars on the road are counted per arrival tick in a ring long enough for the longest delay
+        self._transit = np.zeros((int(self._route_delay.max()) + 1,) + shape, dtype=np.int32)
+
+    @property
+    def num_in_transit(self) -> int:
+        return int(self._transit.sum())
+
+    @property
+    def network_frustration(self) -> float:
+        return float(self.total_frustration.sum())
+
+    def sample_chunk(self, start: int) -> None:
+        """
+        Samples the cars entering the network at every lane of every junction for chunk_seconds ticks from start.
+        """
+        stop = start + self.chunk_seconds
+        rates = np.zeros((self.chunk_seconds, self.n_junctions, self.n_lanes))
+        for j, lane_arrivals in enumerate(self.junction_arrivals):
+            for i, arrivals in enumerate(lane_arrivals):
+                if arrivals is not None:
+                    rates[:, j, i] = arrivals.rates_between(start, stop)
+        self._arrival_counts = self.rng.poisson(rates / 60).astype(np.int32)
+        self._chunk_start = start
+
+    def num_new_cars(self) -> np.ndarray:
+        """
+        Returns the cars entering the network plus the routed cars reaching every lane at the current tick.
+        """
+        slot = self.clock.time % len(self._transit)
+        num_new_cars = super().num_new_cars() + self._transit[slot]
+        self._transit[slot] = 0
+        return num_new_cars
+
+    def drive_cars(self, rep: np.ndarray, lane: np.ndarray) -> None:
+        """
+        Drives the oldest car of each given (junction, lane) pair through the junction and sends it down its
+        sampled route.
+        """
+        super().drive_cars(rep, lane)
+        if len(rep) == 0:
+            return
+
+        u = self.rng.random(len(rep))
+        branch = (u[:, None] >= self._route_cum_p[rep, lane]).sum(axis=1)
+        n_branches = self._route_cum_p.shape[2]
+        is_routed = branch < n_branches
+        branch = np.minimum(branch, n_branches - 1)
+
+        dest = self._route_dest[rep, lane, branch]
+        is_routed &= dest >= 0
+        self.num_left_network += int((~is_routed).sum())
+
+        dest = dest[is_routed]
+        slot = (self.clock.time + self._route_delay[rep, lane, branch][is_routed]) % len(self._transit)
+        to_j, to_i = np.unravel_index(dest, (self.n_junctions, self.n_lanes))
+        np.add.at(self._transit, (slot, to_j, to_i), 1)
+
+
+def corridor(
+        n_junctions: int,
+        lanes_config: List[dict],
+        through_lane: int = 0,
+        through_ratio: float = 0.8,
+        travel_delay: int = 30,
+) -> tuple[List[List[dict]], List[dict]]:
+    """
+    Builds a corridor of identical junctions, in which a proportion of the cars leaving the through lane of every
+    junction continues into the through lane of the next one.
+
+    Parameters
+    ----------
+    n_junctions : int
+        Number of junctions along the corridor.
+    lanes_config : List[dict]
+        The lanes of every junction. The through lane of every junction but the first only receives routed cars.
+    through_lane : int, optional
+        Index of the lane running along the corridor, by default 0.
+    through_ratio : float, optional
+        Proportion of the cars leaving the through lane which carry on to the next junction, by default 0.8.
+    travel_delay : int, optional
+        Travel time in seconds between two consecutive junctions, by default 30.
+
+    Returns
+    -------
+    tuple[List[List[dict]], List[dict]]
+        The junctions and routes arguments of NetworkController.
+    """
+    junctions = []
+    for j in range(n_junctions):
+        junction = [dict(lane_config) for lane_config in lanes_config]
+        if j > 0:
+            junction[through_lane]['traffic_rate_fn'] = None
+        junctions.append(junction)
+
+    routes = [
+        {'from': (j, through_lane), 'to': (j + 1, through_lane), 'p': through_ratio, 'delay': travel_delay}
+        for j in range(n_junctions - 1)
+    ]
+    return junctions, routes
@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class TimeBuffer:
+    """
+    Growable FIFO ring buffer of integer timestamps.
+
+    Parameters
+    ----------
+    capacity : int
+        Initial number of timestamps the buffer can hold before it grows.
+    dtype : type
+        Numpy dtype of the stored timestamps.
+
+    Notes
+    -----
+    Index 0 refers to the oldest timestamp still held. The buffer doubles its capacity whenever it is full, so
+    appends are amortised O(1) and no Python object is allocated per stored value.
+    """
+
+    def __init__(self, capacity: int = 64, dtype: type = np.int32):
+        self._data = np.empty(capacity, dtype=dtype)
+        self._head = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, i: int) -> int:
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError('TimeBuffer index out of range')
+        return int(self._data[(self._head + i) % len(self._data)])
+
+    def _grow(self, min_capacity: int) -> None:
+        data = np.empty(max(2 * len(self._data), min_capacity), dtype=self._data.dtype)
+        data[:self._size] = self.to_array()
+        self._data = data
+        self._head = 0
+
+    def append(self, value: int, count: int = 1) -> None:
+        """
+        Appends count copies of value to the newest end of the buffer.
+        """
+        if count <= 0:
+            return
+
+        if self._size + count > len(self._data):
+            self._grow(self._size + count)
+
+        capacity = len(self._data)
+        start = (self._head + self._size) % capacity
+        end = start + count
+        if end <= capacity:
+            self._data[start:end] = value
+        else:
+            self._data[start:] = value
+            self._data[:end - capacity] = value
+        self._size += count
+
+    def popleft(self) -> int:
+        """
+        Removes and returns the oldest timestamp.
+        """
+        if self._size == 0:
+            raise IndexError('pop from an empty TimeBuffer')
+
+        value = int(self._data[self._head])
+        self._head = (self._head + 1) % len(self._data)
+        self._size -= 1
+        return value
+
+    def to_array(self) -> np.ndarray:
+        """
+        Returns a copy of the stored timestamps ordered from oldest to newest.
+        """
+        idx = (self._head + np.arange(self._size)) % len(self._data)
+        return self._data[idx]
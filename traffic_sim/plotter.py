@@ -1,7 +1,139 @@
 from traffic_sim.entities.controller import Controller
+from traffic_sim.results import SimulationResult
 import matplotlib.colors as mcolors
 import matplotlib.pyplot as plt
 import numpy as np
+import math
+
+
+def window_sums(y: np.ndarray, start: int, stop: int, window: int) -> np.ndarray:
+    """
+    Returns the sums of y over windows of the given length centred on every index in [start, stop), as
+    np.convolve(y, np.ones(window), 'same') does, reading only y[start - window // 2:stop + (window - 1) // 2].
+    """
+    lo = max(0, start - window // 2)
+    hi = min(len(y), stop + (window - 1) // 2)
+    cumsum = np.concatenate([[0.], np.cumsum(y[lo:hi], dtype=float)])
+
+    idx = np.arange(start, stop)
+    upper = np.minimum(idx + (window - 1) // 2 + 1, hi) - lo
+    lower = np.maximum(idx - window // 2, lo) - lo
+    return cumsum[upper] - cumsum[lower]
+
+
+def moving_average(y: np.ndarray, window: int) -> np.ndarray:
+    """
+    Returns the centred moving average of y over window points, computed from its cumulative sum.
+    """
+    return window_sums(y, 0, len(y), window) / window
+
+
+def decimate(
+        series: list[np.ndarray],
+        start: int,
+        stop: int,
+        n_bins: int,
+        window: int = 1,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes the min/max envelope of a series over [start, stop), split into n_bins equal bins. Only the requested
+    range is read, so memory-mapped series stay on disk outside it.
+
+    Parameters
+    ----------
+    series : list[np.ndarray]
+        The series to sum point-wise, e.g. the activity of every lane.
+    start : int
+        The first index of the range.
+    stop : int
+        The index after the last one of the range.
+    n_bins : int
+        The number of bins. Ranges shorter than twice this are returned point by point.
+    window : int, optional
+        Length of the moving average applied before decimating, by default 1 (no smoothing).
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray, np.ndarray]
+        The first index of every bin, and the minimum and maximum of the series in every bin.
+    """
+    start, stop = max(0, start), min(len(series[0]), stop)
+    if stop <= start:
+        empty = np.zeros(0)
+        return empty, empty, empty
+
+    if window > 1:
+        y = sum(window_sums(s, start, stop, window) for s in series) / window
+    else:
+        y = sum(np.asarray(s[start:stop], dtype=float) for s in series)
+
+    if len(y) <= 2 * n_bins:
+        return np.arange(start, stop), y, y
+
+    edges = np.linspace(0, len(y), n_bins + 1).astype(np.int64)[:-1]
+    return start + edges, np.minimum.reduceat(y, edges), np.maximum.reduceat(y, edges)
+
+
+class DecimatedLine:
+    """
+    Class drawing a long series on an axis as its min/max envelope, with about as many bins as the axis is wide in
+    pixels. The envelope of the visible range is recomputed whenever the axis is zoomed or panned, so that zooming
+    in reveals the full detail of a long history without ever plotting all of it.
+
+    Parameters
+    ----------
+    ax : plt.Axes
+        The axis to draw on.
+    series : np.ndarray | list[np.ndarray]
+        The series, or several series to sum point-wise. Memory-mapped arrays are only read over the visible range.
+    x_scale : float, optional
+        The x coordinate of index i is i * x_scale, by default 1.
+    window : int, optional
+        Length of the moving average applied before decimating, by default 1 (no smoothing).
+    bins_per_pixel : float, optional
+        Resolution of the envelope, by default 1.
+    **plot_kwargs
+        Keyword arguments forwarded to ax.plot.
+
+    Methods
+    -------
+    draw(xmin, xmax) -> None
+        Recomputes the envelope of the range [xmin, xmax], by default the whole series.
+    """
+
+    def __init__(
+            self,
+            ax: plt.Axes,
+            series: np.ndarray | list[np.ndarray],
+            x_scale: float = 1.,
+            window: int = 1,
+            bins_per_pixel: float = 1.,
+            **plot_kwargs
+    ):
+        self.ax = ax
+        self.series = series if isinstance(series, list) else [series]
+        self.x_scale = x_scale
+        self.window = window
+        self.bins_per_pixel = bins_per_pixel
+        self.line, = ax.plot([], [], **plot_kwargs)
+        self._drawn = None
+        self.draw()
+
+        # the registry only keeps weak references to bound methods, so the closure keeps this line alive. The
+        # limits are changed before the canvas is redrawn, so the new envelope is drawn with them.
+        ax.callbacks.connect('xlim_changed', lambda changed_ax: self.draw(*changed_ax.get_xlim()))
+
+    def draw(self, xmin: float = None, xmax: float = None) -> None:
+        n = len(self.series[0])
+        start = 0 if xmin is None else min(max(0, math.floor(xmin / self.x_scale)), n)
+        stop = n if xmax is None else min(max(0, math.ceil(xmax / self.x_scale) + 1), n)
+        n_bins = max(1, int(self.ax.bbox.width * self.bins_per_pixel))
+        if (start, stop, n_bins) == self._drawn:
+            return
+
+        idx, lo, hi = decimate(self.series, start, stop, n_bins, self.window)
+        self.line.set_data(np.repeat(idx * self.x_scale, 2), np.column_stack([lo, hi]).ravel())
+        self._drawn = (start, stop, n_bins)
 
 
 def plot_frustrations(models: dict) -> None:
@@ -48,17 +180,19 @@ def plot_hist_active(
     Parameters
     ----------
     models : dict
-        A dictionary containing model names as keys and metadata as values.
+        A dictionary containing model names as keys and metadata as values. The metadata holds the
+        SimulationResult of every simulation under 'results'.
     plot_total : bool, optional
         Flag to plot the total number of cars. Defaults to False.
     idx : int, optional
         The index of the model to consider. Defaults to 0.
     smooth : bool, optional
-        Flag to apply smoothing to the active car count. Defaults to False.
+        Flag to apply a 5-minute moving average to the active car count. Defaults to False.
 
     Returns
     -------
-    None
+    list[DecimatedLine]
+        The plotted lines, which are redrawn at full detail when zooming in.
     """
     num_models = len(models)
 
@@ -73,37 +207,36 @@ def plot_hist_active(
         8: (4, 2),
     }
 
+    lines = []
     grid = grid_map.get(num_models, (num_models, 1))
     fig, ax = plt.subplots(*grid, sharex=True)
     if not isinstance(ax, np.ndarray):
         ax = np.array([ax])
 
     for ax_i, (model_name, model_metadata) in zip(ax.flatten(), models.items()):
-        controller = model_metadata['controllers'][idx]
+        result = model_metadata['results'][idx]
         avg_frustration = model_metadata['frustrations'][idx]
-        dom = np.array([i for i in range(controller.clock.time)])
+        lane_activity = result.load_hist()['lane_activity']
+        x_scale = result.hist_step
 
         time_unit = 'seconds'
-        if 120 <= len(dom) < 7200:
+        if 120 <= result.duration < 7200:
             time_unit = 'minutes'
-            dom = dom / 60
-        elif len(dom) >= 7200:
+            x_scale = x_scale / 60
+        elif result.duration >= 7200:
             time_unit = 'hours'
-            dom = dom / (60 * 60)
-
-        for lane, num_active in controller.state_hist['lane_activity'].items():
-
-            if smooth:
-                win_seconds = 300
-                num_active = np.convolve(num_active, np.ones(win_seconds), 'same') / win_seconds
+            x_scale = x_scale / (60 * 60)
 
-            ax_i.plot(dom, num_active, label=f'Lane {lane+1}')
+        window = max(1, 300 // result.hist_step) if smooth else 1
+        for lane, num_active in lane_activity.items():
+            lines.append(DecimatedLine(ax_i, num_active, x_scale, window, label=f'Lane {lane+1}'))
 
         if plot_total:
-            hist = list(controller.state_hist['lane_activity'].values())
-            total = [sum(x) for x in zip(*hist)]
+            lines.append(DecimatedLine(ax_i, list(lane_activity.values()), x_scale, window, label='Total',
+                                       color='black'))
 
-            ax_i.plot(dom, total, label='Total', color='black')
+        ax_i.relim()
+        ax_i.autoscale_view()
 
         title = f'{model_name} frustration: {avg_frustration:.2f}'
         ax_i.set_title(title)
@@ -113,32 +246,45 @@ def plot_hist_active(
         ax_i.legend()
         plt.tight_layout()
 
+    return lines
 
-def plot_rate_estimate(controller: Controller):
+
+def plot_rate_estimate(result: SimulationResult | Controller):
     """
-    Plots the estimated and true traffic rates over time based on the provided controller.
+    Plots the estimated and true traffic rates over time based on the provided simulation result.
 
     Parameters
     ----------
-    controller : Controller
-        The controller containing the necessary information about lanes and traffic.
+    result : SimulationResult | Controller
+        The result of a SnapshotController simulation run with save_hist, or the controller itself.
 
     Returns
     -------
-    None
+    list[DecimatedLine]
+        The estimated rate lines, which are redrawn at full detail when zooming in.
     """
-    dom = [t / 60 / 60 for t in range(controller.clock.time)]
+    if isinstance(result, Controller):
+        result = SimulationResult.from_controller(result)
+    hist = result.load_hist()
+
     fig, ax = plt.subplots(1, 1)
     fig.suptitle('(Smoothed) Estimated vs True Traffic Rate')
-    for i, (lane, col) in enumerate(zip(controller.lanes, mcolors.TABLEAU_COLORS)):
-        rate_estimate = controller.state_hist[f'lane_{i}_wait_time']
-        rate_true = [lane.traffic_rate_fn(t) for t in dom]
+    lines = []
+    for i, (lane, col) in enumerate(zip(result.lanes, mcolors.TABLEAU_COLORS)):
+        rate_estimate = hist[f'lane_{i}_wait_time']
+        x_scale = result.hist_step / 60 / 60
+        lines.append(DecimatedLine(ax, rate_estimate, x_scale, alpha=0.3, color=col))
 
-        ax.plot(dom, rate_estimate,  alpha=0.3, color=col)
+        # the true rate only needs evaluating at the resolution of the figure
+        dom = np.linspace(0, (len(rate_estimate) - 1) * x_scale, 2 * int(ax.bbox.width))
+        rate_true = [lane.traffic_rate_fn(t) for t in dom]
         ax.plot(dom, rate_true, label=f'Lane {i+1}', color=col)
 
+    ax.relim()
+    ax.autoscale_view()
     ax.set_ylabel(f'Cars per minute')
     ax.set_xlabel(f'Time in hours')
     ax.legend()
 
     plt.show()
+    return lines
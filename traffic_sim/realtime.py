@@ -0,0 +1,561 @@
+"""
+Real-time runtime driving a Controller from live or replayed sensor events.
+
+Sensors send one JSON object per line, either over a local socket or from a replay file:
+
+    {"t": 12.4, "lane": 0, "type": "arrival"}
+    {"t": 12.9, "lane": 1, "type": "exit", "n": 2}
+
+where t is the sensor time in seconds (only used when replaying) and n defaults to 1. Malformed lines and events
+with an unknown type, lane or count are logged, counted and skipped. Cars detected during a second reach the
+controller's lanes at the next tick, which runs on a wall-clock schedule. Whenever the strategy's
+is_time_up switches the light, a command is sent back to every connected sensor:
+
+    {"type": "light", "t": 13, "lane": 1, "latency_ms": 0.42}
+
+The latency is measured from the scheduled wall-clock time of the tick to the end of its decision. Sensors which
+do not read their commands fast enough to keep the send buffer under max_write_buffer are disconnected. A fake
+sensor process stands in for the hardware:
+
+    python -m traffic_sim.realtime serve --controller IdleController --param wait_time=20 --param idle_time=5
+    python -m traffic_sim.realtime sensor --duration 600 --speed 10 --record events.jsonl
+    python -m traffic_sim.realtime replay events.jsonl --controller IdleController --param wait_time=20 ...
+"""
+from traffic_sim.strategies import *
+from traffic_sim.entities.arrivals import PoissonArrivals, SensorArrivals
+from traffic_sim.entities.controller import Controller
+from traffic_sim.utils import FRUSTRATION_MAP, RateProfile
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LightCommand:
+    """
+    A light change sent to the rig: lane turned green at controller time t, and how long after the scheduled
+    wall-clock time of its tick the decision was taken.
+    """
+    t: int
+    lane: int
+    latency_ms: float
+
+    def to_json(self) -> str:
+        return json.dumps({'type': 'light', **asdict(self)})
+
+
+def sensor_lanes_config(n_lanes: int) -> list[dict]:
+    """
+    Returns the lanes_config of a controller whose lanes receive their cars from sensors.
+    """
+    return [{'traffic_rate_fn': None, 'arrivals': SensorArrivals()} for _ in range(n_lanes)]
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class RealTimeRuntime:
+    """
+    Class running a controller in real time, ingesting sensor events as they come and taking decisions on a
+    wall-clock schedule.
+
+    Parameters
+    ----------
+    controller : Controller
+        The controller, whose lanes must use SensorArrivals, e.g. built from sensor_lanes_config.
+    speed : float, optional
+        Controller seconds per wall-clock second, by default 1. Replays and tests may run faster than real time.
+    sensed_exits : bool, optional
+        Whether the cars leaving the junction are reported by the sensors, by default True. Otherwise the active lane
+        releases its cars at the controller's exit_rate, as in sim, and exit events are ignored.
+    latency_budget : float, optional
+        Target for the p99 decision latency in seconds, by default 0.02.
+    max_batch : int, optional
+        Largest number of events ingested before yielding to the tick schedule, by default 256. The batch shrinks
+        while the latency runs over half the budget, so that bursts of events cannot delay the decisions.
+    history : int, optional
+        Number of latencies kept for the statistics, by default 2 ** 16.
+    max_write_buffer : int, optional
+        Number of bytes of commands a sensor may leave unread before it is disconnected, by default 64 kB.
+
+    Methods
+    -------
+    validate(event) -> None
+        Raises a ValueError if a decoded sensor event is malformed.
+    ingest(event) -> None
+        Validates and applies one decoded sensor event.
+    serve(host, port, path) -> asyncio.Server
+        Accepts sensor connections on a TCP port, or on a Unix socket if path is given.
+    replay(path) -> None
+        Feeds the events of a replay file at their recorded times.
+    run(duration) -> dict
+        Ticks the controller for duration controller seconds and returns the latency statistics.
+    latency_stats() -> dict
+        The percentiles of the decision latency, in milliseconds.
+    """
+
+    def __init__(
+            self,
+            controller: Controller,
+            speed: float = 1.,
+            sensed_exits: bool = True,
+            latency_budget: float = 0.02,
+            max_batch: int = 256,
+            history: int = 2 ** 16,
+            max_write_buffer: int = 2 ** 16,
+    ):
+        for lane in controller.lanes:
+            if not isinstance(lane.arrivals, SensorArrivals):
+                raise ValueError('Every lane of a real-time controller must use SensorArrivals.')
+
+        self.controller = controller
+        self.speed = speed
+        self.sensed_exits = sensed_exits
+        self.latency_budget = latency_budget
+        self.max_batch = max_batch
+        self.batch = max_batch
+        self.max_write_buffer = max_write_buffer
+
+        self.commands = []
+        self.num_events = 0
+        self.num_rejected_events = 0
+        self.num_dropped_sensors = 0
+        self.num_unmatched_exits = 0
+        self.num_late_ticks = 0
+        self._exits = [0] * controller.n_lanes
+        self._writers = set()
+        self._latencies = np.zeros(history)
+        self._num_latencies = 0
+        self._start = None
+        self._started = asyncio.Event()
+
+    def validate(self, event: dict) -> None:
+        if not isinstance(event, dict):
+            raise ValueError(f'Sensor event must be a JSON object, got {type(event).__name__}.')
+        if event.get('type') not in ('arrival', 'exit'):
+            raise ValueError(f'Unknown sensor event type {event.get("type")!r}.')
+
+        lane = event.get('lane')
+        if not _is_int(lane) or not 0 <= lane < self.controller.n_lanes:
+            raise ValueError(f'Sensor event lane {lane!r} is not in [0, {self.controller.n_lanes}).')
+        num_cars = event.get('n', 1)
+        if not _is_int(num_cars) or num_cars < 1:
+            raise ValueError(f'Sensor event count {num_cars!r} is not a positive integer.')
+
+    def ingest(self, event: dict) -> None:
+        self.validate(event)
+        self._apply(event)
+
+    def _apply(self, event: dict) -> None:
+        lane = event['lane']
+        num_cars = event.get('n', 1)
+        if event['type'] == 'arrival':
+            self.controller.lanes[lane].arrivals.report(num_cars)
+        elif self.sensed_exits:
+            self._exits[lane] += num_cars
+        self.num_events += 1
+
+    def _decode(self, line: bytes | str, replay: bool = False) -> dict | None:
+        """
+        Decodes and validates one line of sensor events, returning None after logging it if it is rejected.
+        Replayed events must also hold their time.
+        """
+        try:
+            event = json.loads(line)
+            self.validate(event)
+            if replay and (not isinstance(event.get('t'), (int, float)) or isinstance(event['t'], bool)):
+                raise ValueError(f'Replayed sensor event time {event.get("t")!r} is not a number.')
+        except ValueError as e:
+            self._reject(line, e)
+            return None
+        return event
+
+    def _reject(self, line: bytes | str, error: Exception) -> None:
+        self.num_rejected_events += 1
+        logger.warning('Rejected sensor event %r (%d rejected so far): %s', line[:200], self.num_rejected_events, error)
+
+    async def _read_events(self, reader: asyncio.StreamReader) -> None:
+        n = 0
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError as e:
+                # a line longer than the reader's limit, which has been discarded
+                self._reject(b'<line over the reader limit>', e)
+                continue
+            if not line:
+                break
+            if line.strip() and (event := self._decode(line)) is not None:
+                self._apply(event)
+            n += 1
+            if n >= self.batch:
+                # lines already buffered are read without suspending, so yield to a tick which may be due
+                n = 0
+                await asyncio.sleep(0)
+
+    async def _handle_sensor(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.add(writer)
+        if self.commands:
+            self._send(self.commands[-1])
+        try:
+            await self._read_events(reader)
+        except (asyncio.CancelledError, ConnectionError):
+            # the runtime stopped, or the sensor went away
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765, path: str = None) -> asyncio.Server:
+        if path is not None:
+            return await asyncio.start_unix_server(self._handle_sensor, path=path)
+        return await asyncio.start_server(self._handle_sensor, host, port)
+
+    async def replay(self, path: str | Path) -> None:
+        loop = asyncio.get_running_loop()
+        await self._started.wait()
+
+        n = 0
+        with open(path) as f:
+            for line in f:
+                if not line.strip() or (event := self._decode(line, replay=True)) is None:
+                    continue
+                delay = self._start + event['t'] / self.speed - loop.time()
+                if delay > 0:
+                    n = 0
+                    await asyncio.sleep(delay)
+                self._apply(event)
+                n += 1
+                if n >= self.batch:
+                    n = 0
+                    await asyncio.sleep(0)
+
+    def _send(self, command: LightCommand) -> None:
+        message = (command.to_json() + '\n').encode()
+        for writer in list(self._writers):
+            if writer.transport.get_write_buffer_size() + len(message) > self.max_write_buffer:
+                # the sensor stopped reading its commands, drop it rather than buffering them without bound
+                logger.warning('Disconnecting sensor %s, which left %d bytes of commands unread.',
+                               writer.get_extra_info('peername'), writer.transport.get_write_buffer_size())
+                self.num_dropped_sensors += 1
+                self._writers.discard(writer)
+                writer.transport.abort()
+                continue
+            writer.write(message)
+
+    def _record_latency(self, latency: float) -> None:
+        self._latencies[self._num_latencies % len(self._latencies)] = latency
+        self._num_latencies += 1
+
+        # shrink the ingestion batch multiplicatively while the latency runs high, grow it back slowly otherwise
+        if latency > self.latency_budget / 2:
+            self.batch = max(1, self.batch // 2)
+        else:
+            self.batch = min(self.max_batch, self.batch + 1)
+
+    def tick(self, scheduled: float) -> LightCommand | None:
+        """
+        Advances the controller by one second: adds the cars detected since the last tick, removes the cars which
+        left, and switches the light if the strategy decides so.
+
+        Parameters
+        ----------
+        scheduled : float
+            The event loop time at which the tick was due, from which the decision latency is measured.
+
+        Returns
+        -------
+        LightCommand | None
+            The light change, if any.
+        """
+        c = self.controller
+        c.clock.tick()
+
+        for lane in c.lanes:
+            lane.update_new_active()
+
+        if self.sensed_exits:
+            for lane_num, lane in enumerate(c.lanes):
+                num_exits = min(self._exits[lane_num], lane.num_active_cars)
+                for _ in range(num_exits):
+                    lane.drive_car()
+                self.num_unmatched_exits += self._exits[lane_num] - num_exits
+                self._exits[lane_num] = 0
+        elif c.active_lane.num_active_cars > 0 and c.clock.time - c.active_lane.last_exit_time >= 1 / c.exit_rate:
+            c.active_lane.drive_car()
+
+        command = None
+        if c.is_time_up():
+            c.run_next_lane()
+            command = LightCommand(c.clock.time, c.active_lane_num, 0.)
+
+        if c.save_hist:
+            c.update_hist()
+
+        latency = asyncio.get_running_loop().time() - scheduled
+        self._record_latency(latency)
+        if command is not None:
+            command.latency_ms = latency * 1000
+            self.commands.append(command)
+            self._send(command)
+        return command
+
+    async def run(self, duration: int) -> dict:
+        loop = asyncio.get_running_loop()
+        c = self.controller
+        self._start = loop.time() - c.clock.time / self.speed
+        self._started.set()
+        end_time = c.clock.time + duration
+
+        initial = LightCommand(c.clock.time, c.active_lane_num, 0.)
+        self.commands.append(initial)
+        self._send(initial)
+
+        while c.clock.time < end_time:
+            scheduled = self._start + (c.clock.time + c.clock.step) / self.speed
+            delay = scheduled - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.num_late_ticks += 1
+            self.tick(scheduled)
+
+        for writer in list(self._writers):
+            try:
+                await asyncio.wait_for(writer.drain(), timeout=1.)
+            except (ConnectionError, asyncio.TimeoutError):
+                pass
+        return self.latency_stats()
+
+    def latency_stats(self) -> dict:
+        latencies = self._latencies[:min(self._num_latencies, len(self._latencies))] * 1000
+        if len(latencies) == 0:
+            return {}
+        p50, p99 = np.percentile(latencies, [50, 99])
+        return {
+            'ticks': self._num_latencies,
+            'events': self.num_events,
+            'rejected_events': self.num_rejected_events,
+            'dropped_sensors': self.num_dropped_sensors,
+            'switches': len(self.commands) - 1,
+            'p50_ms': float(p50),
+            'p99_ms': float(p99),
+            'max_ms': float(latencies.max()),
+            'budget_ms': self.latency_budget * 1000,
+            'over_budget': int((latencies > self.latency_budget * 1000).sum()),
+            'within_budget': bool(p99 <= self.latency_budget * 1000),
+            'late_ticks': self.num_late_ticks,
+            'unmatched_exits': self.num_unmatched_exits,
+        }
+
+
+async def fake_sensor(
+        lanes_config: list[dict],
+        exit_rate: float = 1.,
+        duration: int = 3600,
+        speed: float = 1.,
+        host: str = '127.0.0.1',
+        port: int = 8765,
+        path: str = None,
+        seed: int = None,
+        burst_prob: float = 0.,
+        burst_size: int = 50,
+        record: str | Path = None,
+) -> int:
+    """
+    Stands in for the sensors of a junction. Cars arrive at every lane as Poisson arrivals of its traffic_rate_fn,
+    queue, and leave the lane the runtime last turned green at exit_rate, every arrival and exit being sent to the
+    runtime as it happens.
+
+    Parameters
+    ----------
+    lanes_config : list[dict]
+        The traffic_rate_fn of every lane, as passed to sim.
+    exit_rate : float, optional
+        The rate at which cars leave the green lane, by default 1.
+    duration : int, optional
+        Sensor seconds to run for, by default an hour.
+    speed : float, optional
+        Sensor seconds per wall-clock second, by default 1. Must match the runtime's.
+    host : str, optional
+        Host of the runtime, by default the local one.
+    port : int, optional
+        TCP port of the runtime, by default 8765.
+    path : str, optional
+        Unix socket of the runtime, used instead of host and port if given.
+    seed : int, optional
+        Seed of the arrivals, by default None (fresh entropy).
+    burst_prob : float, optional
+        Probability that a lane receives an extra burst of cars in a given second, by default 0.
+    burst_size : int, optional
+        Number of cars in every burst, each sent as its own event, by default 50.
+    record : str | Path, optional
+        Also write every event to this replay file, by default None.
+
+    Returns
+    -------
+    int
+        The number of events sent.
+    """
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+
+    rng = np.random.default_rng(seed)
+    arrivals = [
+        PoissonArrivals(lane_config['traffic_rate_fn'], rng=lane_rng)
+        for lane_config, lane_rng in zip(lanes_config, rng.spawn(len(lanes_config)))
+    ]
+    queues = [0] * len(lanes_config)
+    green = [0]
+    last_exit = -np.inf
+
+    async def listen():
+        while line := await reader.readline():
+            command = json.loads(line)
+            if command.get('type') == 'light':
+                green[0] = command['lane']
+
+    listener = asyncio.create_task(listen())
+    log = open(record, 'w') if record is not None else None
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    num_events = 0
+
+    try:
+        for t in range(1, duration + 1):
+            # events of second t are sent half-way through the second before the runtime's tick t
+            await asyncio.sleep(max(0., start + (t - .5) / speed - loop.time()))
+
+            lines = []
+            for lane_num, lane_arrivals in enumerate(arrivals):
+                num_cars = lane_arrivals.num_arrivals(t)
+                if rng.random() < burst_prob:
+                    num_cars += burst_size
+                queues[lane_num] += num_cars
+                lines += [{'t': t - .5, 'lane': lane_num, 'type': 'arrival'}] * num_cars
+
+            if queues[green[0]] > 0 and t - last_exit >= 1 / exit_rate:
+                queues[green[0]] -= 1
+                last_exit = t
+                lines.append({'t': t - .5, 'lane': green[0], 'type': 'exit'})
+
+            payload = ''.join(json.dumps(line) + '\n' for line in lines)
+            writer.write(payload.encode())
+            if log is not None:
+                log.write(payload)
+            num_events += len(lines)
+            await writer.drain()
+    finally:
+        listener.cancel()
+        writer.close()
+        if log is not None:
+            log.close()
+    return num_events
+
+
+def _run_fake_sensor(kwargs: dict) -> int:
+    return asyncio.run(fake_sensor(**kwargs))
+
+
+def spawn_fake_sensor(**kwargs) -> multiprocessing.Process:
+    """
+    Starts fake_sensor in its own process, with the given keyword arguments.
+    """
+    process = multiprocessing.Process(target=_run_fake_sensor, args=(kwargs,))
+    process.start()
+    return process
+
+
+def make_controller(
+        controller: Callable,
+        n_lanes: int,
+        exit_rate: float = 1.,
+        frustration_fn: Callable = FRUSTRATION_MAP['quad'],
+        **strategy_kwargs
+) -> Controller:
+    """
+    Instantiates a controller whose lanes are fed by sensors.
+    """
+    return controller(
+        lanes_config=sensor_lanes_config(n_lanes),
+        exit_rate=exit_rate,
+        frustration_fn=frustration_fn,
+        **strategy_kwargs
+    )
+
+
+def _parse_params(params: list[str]) -> dict:
+    kwargs = {}
+    for param in params:
+        key, value = param.split('=', 1)
+        kwargs[key] = json.loads(value)
+    return kwargs
+
+
+async def _serve(args: argparse.Namespace, replay: str = None) -> dict:
+    c = make_controller(globals()[args.controller], args.lanes, args.exit_rate, **_parse_params(args.param))
+    runtime = RealTimeRuntime(
+        c,
+        speed=args.speed,
+        sensed_exits=replay is None or args.sensed_exits,
+        latency_budget=args.budget_ms / 1000,
+    )
+    if replay is not None:
+        replayer = asyncio.create_task(runtime.replay(replay))
+        stats = await runtime.run(args.duration)
+        replayer.cancel()
+        return stats
+
+    server = await runtime.serve(args.host, args.port, args.path)
+    async with server:
+        return await runtime.run(args.duration)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Run a controller in real time, or a fake sensor feeding it.')
+    parser.add_argument('mode', choices=['serve', 'replay', 'sensor'])
+    parser.add_argument('replay_file', nargs='?', help='The replay file, in replay mode.')
+    parser.add_argument('--controller', default='IdleController')
+    parser.add_argument('--param', action='append', default=[], help='Strategy keyword argument as key=value.')
+    parser.add_argument('--lanes', type=int, default=3)
+    parser.add_argument('--exit-rate', type=float, default=1.)
+    parser.add_argument('--duration', type=int, default=3600, help='Controller or sensor seconds to run for.')
+    parser.add_argument('--speed', type=float, default=1., help='Controller seconds per wall-clock second.')
+    parser.add_argument('--budget-ms', type=float, default=20., help='Target p99 decision latency.')
+    parser.add_argument('--sensed-exits', action='store_true', help='Apply the exits of the replay file.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--path', help='Unix socket to use instead of the TCP port.')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--burst-prob', type=float, default=0.)
+    parser.add_argument('--burst-size', type=int, default=50)
+    parser.add_argument('--record', help='Write the events sent by the fake sensor to this replay file.')
+    args = parser.parse_args()
+
+    if args.mode == 'sensor':
+        lanes_config = [
+            {'traffic_rate_fn': RateProfile(morning_peak_rate=10 + 5 * i, evening_peak_rate=20 - 5 * i)}
+            for i in range(args.lanes)
+        ]
+        n = asyncio.run(fake_sensor(
+            lanes_config, args.exit_rate, args.duration, args.speed, args.host, args.port, args.path, args.seed,
+            args.burst_prob, args.burst_size, args.record,
+        ))
+        print(f'Sent {n} events.')
+    else:
+        stats = asyncio.run(_serve(args, args.replay_file if args.mode == 'replay' else None))
+        for key, value in stats.items():
+            print(f'{key:<16} {value}')
@@ -0,0 +1,208 @@
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import numpy as np
+
+from traffic_sim.entities.batch_controller import BatchController
+from traffic_sim.entities.controller import Controller
+from traffic_sim.entities.history import load_history
+from traffic_sim.utils import PhaseProfiler
+
+
+@dataclass
+class LaneResult:
+    """
+    Summary of a single lane at the end of a simulation.
+
+    Attributes
+    ----------
+    num_passed : int
+        Number of cars which exited the lane.
+    num_active : int
+        Number of cars still waiting in the lane.
+    passed_frustration : float
+        Total frustration of the cars which exited the lane.
+    active_frustration : float
+        Total frustration of the cars still waiting in the lane.
+    mean_wait : float
+        Average waiting time in seconds of the cars which exited the lane.
+    max_wait : float
+        Longest waiting time in seconds of the cars which exited the lane.
+    traffic_rate_fn : Callable, optional
+        The traffic rate function of the lane, kept for plotting the true rate.
+    """
+    num_passed: int
+    num_active: int
+    passed_frustration: float
+    active_frustration: float
+    mean_wait: float
+    max_wait: float
+    traffic_rate_fn: Optional[Callable] = None
+
+
+@dataclass
+class SimulationResult:
+    """
+    Compact summary of a simulation, cheap to send back from pool workers.
+
+    Attributes
+    ----------
+    controller_name : str
+        Name of the controller class which was simulated.
+    duration : int
+        Simulated time in seconds.
+    total_frustration : float
+        Total frustration of all cars, passed and waiting.
+    num_passed : int
+        Number of cars which exited the junction.
+    num_active : int
+        Number of cars still waiting at the end of the simulation.
+    lanes : list[LaneResult]
+        Per-lane summaries.
+    hist : dict, optional
+        The controller's state_hist, with one value every hist_step seconds.
+    hist_path : str, optional
+        Where the history was streamed to instead, read lazily by load_hist.
+    hist_step : int
+        Number of seconds between two history values.
+    controller : Controller, optional
+        The full controller, only kept when explicitly requested.
+    profile : PhaseProfiler, optional
+        The time spent in every phase of the simulation, if it was profiled.
+    """
+    controller_name: str
+    duration: int
+    total_frustration: float
+    num_passed: int
+    num_active: int
+    lanes: list[LaneResult] = field(default_factory=list)
+    hist: Optional[dict] = None
+    hist_path: Optional[str] = None
+    hist_step: int = 1
+    controller: Optional[Controller] = None
+    profile: Optional[PhaseProfiler] = None
+
+    @property
+    def avg_frustration(self) -> float:
+        return self.total_frustration / self.num_passed
+
+    @property
+    def has_hist(self) -> bool:
+        return self.hist is not None or self.hist_path is not None
+
+    def load_hist(self) -> Optional[dict]:
+        """
+        Returns the history, memory mapping it from hist_path if it was streamed to disk.
+        """
+        if self.hist is None and self.hist_path is not None:
+            return load_history(self.hist_path)
+        return self.hist
+
+    @classmethod
+    def from_controller(
+            cls,
+            controller: Controller,
+            hist_step: int = 1,
+            keep_controller: bool = False,
+    ) -> 'SimulationResult':
+        """
+        Summarises a controller at the end of its simulation.
+
+        Parameters
+        ----------
+        controller : Controller
+            The simulated controller.
+        hist_step : int, optional
+            Further keep only one in every hist_step recorded history values, by default 1. Ignored for histories
+            streamed to disk, which are kept whole.
+        keep_controller : bool, optional
+            Whether to keep a reference to the full controller, by default False.
+
+        Returns
+        -------
+        SimulationResult
+            The summary of the simulation.
+        """
+        lanes = []
+        for lane in controller.lanes:
+            passed_waits = lane.passed_waits
+            lanes.append(LaneResult(
+                num_passed=lane.num_passed_cars,
+                num_active=lane.num_active_cars,
+                passed_frustration=lane.passed_frustration,
+                active_frustration=lane.active_frustration,
+                mean_wait=float(passed_waits.mean()) if len(passed_waits) else np.nan,
+                max_wait=float(passed_waits.max()) if len(passed_waits) else np.nan,
+                traffic_rate_fn=lane.traffic_rate_fn,
+            ))
+
+        hist, hist_path = None, None
+        if controller.save_hist and controller.hist.path is not None:
+            controller.hist.flush()
+            hist_path, hist_step = str(controller.hist.path), 1
+        elif controller.save_hist:
+            hist = _downsample(controller.state_hist, hist_step)
+
+        return cls(
+            controller_name=type(controller).__name__,
+            duration=controller.clock.time,
+            total_frustration=controller.total_frustration,
+            num_passed=controller.num_passed,
+            num_active=controller.num_active,
+            lanes=lanes,
+            hist=hist,
+            hist_path=hist_path,
+            hist_step=controller.hist.every * hist_step if controller.hist is not None else hist_step,
+            controller=controller if keep_controller else None,
+            profile=controller.profiler,
+        )
+
+    @classmethod
+    def from_batch(cls, batch: BatchController) -> list['SimulationResult']:
+        """
+        Summarises every replicate of a BatchController at the end of its simulation.
+
+        Parameters
+        ----------
+        batch : BatchController
+            The simulated batch of replicates.
+
+        Returns
+        -------
+        list[SimulationResult]
+            One summary per replicate. No history is available.
+        """
+        lane_active_frustration = batch.lane_active_frustration
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_wait = batch.passed_waiting_time / batch.num_passed_cars
+        max_wait = np.where(batch.num_passed_cars > 0, batch.max_passed_wait, np.nan)
+
+        results = []
+        for r in range(batch.n_sim):
+            lanes = [
+                LaneResult(
+                    num_passed=int(batch.num_passed_cars[r, i]),
+                    num_active=int(batch.num_active_cars[r, i]),
+                    passed_frustration=float(batch.passed_frustration[r, i]),
+                    active_frustration=float(lane_active_frustration[r, i]),
+                    mean_wait=float(mean_wait[r, i]),
+                    max_wait=float(max_wait[r, i]),
+                    traffic_rate_fn=batch.traffic_rate_fns[i],
+                )
+                for i in range(batch.n_lanes)
+            ]
+            results.append(cls(
+                controller_name=batch.strategy.__name__,
+                duration=batch.clock.time,
+                total_frustration=float(batch.passed_frustration[r].sum() + lane_active_frustration[r].sum()),
+                num_passed=int(batch.num_passed_cars[r].sum()),
+                num_active=int(batch.num_active_cars[r].sum()),
+                lanes=lanes,
+            ))
+        return results
+
+
+def _downsample(hist: dict | list, step: int) -> dict | np.ndarray:
+    if isinstance(hist, dict):
+        return {key: _downsample(val, step) for key, val in hist.items()}
+    return np.asarray(hist)[::step]
@@ -1,12 +1,20 @@
 from traffic_sim.strategies import *
 from typing import Callable
 from traffic_sim.entities.controller import Controller
-from traffic_sim.utils import print_padding, timer, FRUSTRATION_MAP, traffic_rate
+from traffic_sim.entities.batch_controller import BatchController
+from traffic_sim.entities.network import NetworkController
+from traffic_sim.results import SimulationResult
+from traffic_sim.checkpoint import fork_state
+from traffic_sim.cache import ResultCache, result_key
+from traffic_sim.comparison import paired_differences, print_paired_differences
+from traffic_sim.utils import print_padding, timer, FRUSTRATION_MAP, RateProfile, RunningStats, PhaseProfiler
 from traffic_sim.plotter import plot_frustrations, plot_hist_active, plot_rate_estimate
 import concurrent.futures
+import math
 import matplotlib.pyplot as plt
 from pathlib import Path
 import yaml
+import numpy as np
 from functools import partial
 
 
@@ -18,6 +26,14 @@ def sim(
     verbose=False,
     save_hist=False,
     duration_hours: float = 24,
+    event_driven: bool = False,
+    seed: int | np.random.SeedSequence = None,
+    hist_every: int = 1,
+    hist_path: str = None,
+    profile: bool = False,
+    checkpoint: str | Path | Controller = None,
+    time_step: int = None,
+    adaptive_step: bool = True,
     **strategy_kwargs
 ) -> Controller:
     """
@@ -39,6 +55,32 @@ def sim(
         Whether to save the simulation history, by default False.
     duration_hours : float, optional
         Duration of the simulation in hours, by default 24.
+    event_driven : bool, optional
+        Whether to jump over the seconds in which no car arrives or exits and no decision is due, using
+        Controller.run_until, by default False. The resulting dynamics are the same as ticking every second. At the
+        default rates almost every second has an arrival, so the speedup is small (about 1.0s for 24 hours either
+        way); it pays off on sparse traffic, e.g. at night or on quiet lanes. Cannot be combined with time_step.
+    seed : int | np.random.SeedSequence, optional
+        Seed of the simulation's random generator, by default None (fresh entropy).
+    hist_every : int, optional
+        Record the history once every hist_every seconds, by default 1.
+    hist_path : str, optional
+        Stream the history to this directory of .npy files, or .parquet file, by default None (kept in memory).
+    profile : bool, optional
+        Whether to time every phase of run_iter into the controller's profiler, by default False.
+    checkpoint : str | Path | Controller, optional
+        A checkpoint file written by save_checkpoint, or a controller, to start from instead of an empty junction at
+        time 0. The simulation then runs for duration_hours from the checkpoint's time, and the controller may use a
+        different strategy. If seed is given, the arrivals after the checkpoint are drawn from it, otherwise every
+        branch sees the same future arrivals. By default None.
+    time_step : int, optional
+        Advance the simulation by steps of up to time_step seconds with Controller.run_step, drawing the arrivals
+        of the whole step at once and releasing its cars at their exact exit times. Cannot be combined with
+        event_driven. Defaults to None (every second).
+    adaptive_step : bool, optional
+        Whether to end every step at the strategy's next decision time, by default True. Otherwise the strategy is
+        only consulted every time_step seconds, so every switch is delayed to the end of its step and green times
+        shorter than time_step are stretched to it.
     **strategy_kwargs
         Additional keyword arguments to be passed to the controller.
 
@@ -47,20 +89,45 @@ def sim(
     Controller
         The instantiated controller object after the simulation.
 
+    Raises:
+    -------
+    ValueError
+        If both event_driven and time_step are set.
+
     Notes:
     ------
     This function simulates the traffic flow in N lanes using the specified controller function
     and lane configurations for a given duration in hours.
     """
+    if event_driven and time_step is not None:
+        raise ValueError('event_driven and time_step are alternative ways to advance the clock, set only one of them.')
+
+    warm_start = None if checkpoint is None else fork_state(checkpoint, seed)
+    start_time = 0 if warm_start is None else warm_start.clock.time
+    end_time = start_time + math.ceil(duration_hours * 60 * 60)
+
     c = controller(
         lanes_config=lanes_config,
         exit_rate=exit_rate,
         save_hist=save_hist,
         frustration_fn=frustration_fn,
+        rng=np.random.default_rng(seed),
+        hist_every=hist_every,
+        hist_seconds=math.ceil(duration_hours * 60 * 60),
+        hist_path=hist_path if save_hist else None,
+        profile=profile,
+        warm_start=warm_start,
         **strategy_kwargs
     )
 
-    while c.clock.time / 60 / 60 < duration_hours:
+    if event_driven:
+        c.run_until(end_time)
+
+    if time_step is not None:
+        while c.clock.time < end_time:
+            c.run_step(min(time_step, end_time - c.clock.time), adaptive=adaptive_step)
+
+    while c.clock.time < end_time:
         c.run_iter()
         if verbose:
             print(f'-----Time = {c.clock.time}-----')
@@ -68,6 +135,9 @@ def sim(
             print(f'Number Pending = {c.num_active}')
             print(f'Number Pending = {c.num_passed}')
 
+    if c.hist is not None:
+        c.hist.close()
+
     if verbose:
         print('Total frustration = {:,}'.format(c.total_frustration))
         print('Average frustration = {:,.2f}'.format(c.total_frustration / c.num_passed))
@@ -76,8 +146,136 @@ def sim(
     return c
 
 
-def sim_pool(kwargs: dict) -> Controller:
-    return sim(**kwargs)
+def sim_pool(kwargs: dict, keep_controller: bool = False) -> SimulationResult:
+    c = sim(**kwargs)
+    return SimulationResult.from_controller(c, keep_controller=keep_controller)
+
+
+def batch_sim(
+    controller: Callable,
+    n_sim: int,
+    lanes_config: list[dict],
+    exit_rate: float = 0.5,
+    frustration_fn: Callable = lambda x: x**2,
+    verbose=False,
+    duration_hours: float = 24,
+    seed: int | np.random.SeedSequence = None,
+    **strategy_kwargs
+) -> BatchController:
+    """
+    Simulate n_sim replicates of traffic flow in N lanes at once using vectorised numpy state.
+
+    Parameters:
+    ----------
+    controller : Callable
+        The controller class whose strategy is applied. Must implement is_time_up_batch.
+    n_sim : int
+        Number of replicates to simulate.
+    lanes_config : list[dict]
+        List of dictionaries containing configuration details for each lane.
+    exit_rate : float, optional
+        The rate at which cars exit the system, by default 0.5.
+    frustration_fn : Callable, optional
+        Vectorised function to calculate frustration, by default lambda x: x**2.
+    verbose : bool, optional
+        Whether to print summary simulation information, by default False.
+    duration_hours : float, optional
+        Duration of the simulation in hours, by default 24.
+    seed : int | np.random.SeedSequence, optional
+        Root seed of the batch, by default None (fresh entropy). Replicate k is seeded with its k-th child, as in
+        main's process pool, so that a batched and a pooled model run on the same seed see the same arrivals.
+    **strategy_kwargs
+        Additional keyword arguments to be passed to the controller's strategy.
+
+    Returns:
+    -------
+    BatchController
+        The batch controller holding the final state of every replicate.
+
+    Notes:
+    ------
+    Each replicate follows the same dynamics as sim(), so the resulting frustrations are identically distributed.
+    """
+    root_seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    c = BatchController(
+        strategy=controller,
+        n_sim=n_sim,
+        lanes_config=lanes_config,
+        exit_rate=exit_rate,
+        frustration_fn=frustration_fn,
+        seeds=root_seed.spawn(n_sim),
+        **strategy_kwargs
+    )
+
+    while c.clock.time / 60 / 60 < duration_hours:
+        c.run_iter()
+
+    if verbose:
+        print('Average frustration = {:,.2f}'.format(np.mean(c.total_frustration / c.num_passed)))
+        print('Average total cars = {:,.1f}'.format(np.mean(c.num_passed)))
+
+    return c
+
+
+def network_sim(
+    controller: Callable,
+    junctions: list[list[dict]],
+    routes: list[dict],
+    exit_rate: float = 0.5,
+    frustration_fn: Callable = lambda x: x**2,
+    verbose=False,
+    duration_hours: float = 24,
+    seed: int | np.random.SeedSequence = None,
+    **strategy_kwargs
+) -> NetworkController:
+    """
+    Simulate a road network of junctions, in which the cars leaving a junction are routed into downstream ones.
+
+    Parameters:
+    ----------
+    controller : Callable
+        The controller class whose strategy is applied at every junction. Must implement is_time_up_batch.
+    junctions : list[list[dict]]
+        The lanes_config of every junction, see NetworkController.
+    routes : list[dict]
+        The turning ratios and travel delays between junctions, see NetworkController.
+    exit_rate : float, optional
+        The rate at which cars exit the system, by default 0.5.
+    frustration_fn : Callable, optional
+        Vectorised function to calculate frustration, by default lambda x: x**2.
+    verbose : bool, optional
+        Whether to print summary simulation information, by default False.
+    duration_hours : float, optional
+        Duration of the simulation in hours, by default 24.
+    seed : int | np.random.SeedSequence, optional
+        Seed of the network's random generator, by default None (fresh entropy).
+    **strategy_kwargs
+        Additional keyword arguments to be passed to the controller's strategy.
+
+    Returns:
+    -------
+    NetworkController
+        The network controller holding the final state of every junction.
+    """
+    c = NetworkController(
+        strategy=controller,
+        junctions=junctions,
+        routes=routes,
+        exit_rate=exit_rate,
+        frustration_fn=frustration_fn,
+        rng=np.random.default_rng(seed),
+        **strategy_kwargs
+    )
+
+    while c.clock.time / 60 / 60 < duration_hours:
+        c.run_iter()
+
+    if verbose:
+        print('Network frustration = {:,.2f}'.format(c.network_frustration))
+        print('Cars through junctions = {:,}'.format(int(c.num_passed.sum())))
+        print('Cars left the network = {:,}'.format(c.num_left_network))
+
+    return c
 
 
 @timer
@@ -89,6 +287,19 @@ def main(
     frustration_fn: Callable = lambda x: x ** 2,
     verbose=False,
     save_hist=False,
+    vectorised=False,
+    event_driven=False,
+    hist_step=1,
+    keep_controllers=False,
+    seed=None,
+    hist_dir=None,
+    hist_format='npy',
+    rel_ci=None,
+    max_sim=None,
+    confidence=0.95,
+    profile=False,
+    cache_dir=None,
+    cache_max_mb=1024,
     **strategy_kwargs
 ):
     """
@@ -99,7 +310,7 @@ def main(
     controller : Callable
         The controller function to control the traffic flow.
     n_sim : int
-        Number of simulations to run.
+        Number of simulations to run, or the size of every wave of simulations if rel_ci is set.
     lanes_config : list[dict]
         List of dictionaries containing configuration details for each lane.
     exit_rate : float, optional
@@ -110,13 +321,80 @@ def main(
         Whether to print detailed simulation information.
     save_hist : bool, optional
         Whether to save the simulation history.
+    vectorised : bool, optional
+        Whether to step all replicates together in a single BatchController instead of a process pool.
+        Only used when the controller implements is_time_up_batch. No history or controllers are kept. Replicates
+        are seeded as in the process pool, so vectorised and pooled models still share common random numbers.
+    event_driven : bool, optional
+        Whether each simulation jumps over the seconds in which nothing happens.
+    hist_step : int, optional
+        Number of seconds between two recorded history values.
+    keep_controllers : bool, optional
+        Whether to send the full controllers back from the pool workers, e.g. for custom plots.
+        Only the compact SimulationResult summaries are returned otherwise.
+    seed : int, optional
+        Root seed of the run. Every replicate gets its own child of np.random.SeedSequence(seed), so replicates
+        are independent and reproducible. Every lane draws its arrivals from its own generator, so replicate k sees
+        the same arrivals whatever the controller: running several controllers with the same seed compares them
+        on common random numbers. Defaults to None (fresh entropy).
+    hist_dir : str, optional
+        Stream the history of every simulation to hist_dir/replicate_<k>, which is read back lazily, instead of
+        sending it back from the pool workers. Defaults to None.
+    hist_format : str, optional
+        Format of the streamed histories, either 'npy' (a directory of memory mappable .npy files) or 'parquet'
+        (requires pyarrow). Defaults to 'npy'.
+    rel_ci : float, optional
+        Target half-width of the confidence interval of the mean average frustration, relative to the mean. If set,
+        waves of n_sim simulations are run until it is reached or max_sim simulations have run. Ignored by the
+        vectorised runs. Defaults to None (a single wave).
+    max_sim : int, optional
+        Maximum number of simulations when rel_ci is set. Defaults to 10 * n_sim.
+    confidence : float, optional
+        Confidence level of the reported interval. Defaults to 0.95.
+    profile : bool, optional
+        Whether to time every phase of run_iter in every simulation, and print the profile summed over all of them.
+        Ignored by the vectorised runs. Defaults to False.
+    cache_dir : str, optional
+        Directory of the on-disk result cache. Replicates whose inputs and code version were already simulated are
+        read from it, and only the missing ones are run. Only used with a fixed seed, and without save_hist,
+        keep_controllers, profile or a checkpoint. Defaults to None (no cache).
+    cache_max_mb : float, optional
+        Size bound of the cache in MB, beyond which the least recently used results are evicted. Defaults to 1024.
     **strategy_kwargs
         Additional keyword arguments to be passed to the controller.
 
     Returns
     -------
-    None
+    dict
+        The average frustration of every simulation under 'frustrations', their SimulationResult summaries
+        under 'results', the full controllers under 'controllers' if keep_controllers is set, and the achieved
+        precision of the mean average frustration under 'precision', and the summed PhaseProfiler under 'profile'
+        if profile is set.
     """
+    if vectorised and hasattr(controller, 'is_time_up_batch'):
+        print(f'Running vectorised simulations ({controller.__name__})...', end='')
+        c = batch_sim(
+            controller=controller,
+            n_sim=n_sim,
+            lanes_config=lanes_config,
+            exit_rate=exit_rate,
+            frustration_fn=frustration_fn,
+            seed=seed,
+            **strategy_kwargs
+        )
+        print('done')
+        results = SimulationResult.from_batch(c)
+        frustrations = [result.avg_frustration for result in results]
+        stats = RunningStats()
+        for frustration in frustrations:
+            stats.update(frustration)
+        return {
+            'frustrations': frustrations,
+            'results': results,
+            'controllers': [],
+            'precision': stats.summary(confidence),
+        }
+
     sim_kwargs = dict(
         controller=controller,
         lanes_config=lanes_config,
@@ -124,22 +402,72 @@ def main(
         frustration_fn=frustration_fn,
         verbose=verbose,
         save_hist=save_hist,
+        event_driven=event_driven,
+        hist_every=hist_step,
+        profile=profile,
         **strategy_kwargs
     )
 
+    max_sim = n_sim if rel_ci is None else (10 * n_sim if max_sim is None else max_sim)
+
+    use_cache = cache_dir is not None and seed is not None and not (
+        save_hist or keep_controllers or profile or strategy_kwargs.get('checkpoint') is not None
+    )
+    cache = ResultCache(cache_dir, max_bytes=int(cache_max_mb * 2 ** 20)) if use_cache else None
+
     print(f'Running simulations ({controller.__name__})...', end='')
+    root_seed = np.random.SeedSequence(seed)
+    pool_fn = partial(sim_pool, keep_controller=keep_controllers)
+    stats = RunningStats()
+    results = []
+    n_cached = 0
     with concurrent.futures.ProcessPoolExecutor() as executor:
-        controllers = executor.map(sim_pool, [sim_kwargs] * n_sim)
-    print('done')
+        while len(results) < max_sim:
+            jobs = [{**sim_kwargs, 'seed': s} for s in root_seed.spawn(min(n_sim, max_sim - len(results)))]
+            if hist_dir is not None:
+                suffix = '.parquet' if hist_format == 'parquet' else ''
+                for k, job in enumerate(jobs, start=len(results)):
+                    job['hist_path'] = str(Path(hist_dir) / f'replicate_{k}{suffix}')
+
+            wave = [None] * len(jobs)
+            if cache is not None:
+                keys = [result_key(job) for job in jobs]
+                wave = [cache.get(key) for key in keys]
+                n_cached += sum(result is not None for result in wave)
+
+            missing = [i for i, result in enumerate(wave) if result is None]
+            for i, result in zip(missing, executor.map(pool_fn, [jobs[i] for i in missing])):
+                wave[i] = result
+                if cache is not None:
+                    cache.put(keys[i], result)
 
-    # I want to refer to these values again in the future
-    controllers = list(controllers)
-    frustrations = []
-    for c in controllers:
-        avg_frustration = c.total_frustration / c.num_passed
-        frustrations.append(avg_frustration)
+            for result in wave:
+                results.append(result)
+                stats.update(result.avg_frustration)
 
-    return {'frustrations': frustrations, 'controllers': controllers}
+            if rel_ci is None or stats.rel_half_width(confidence) <= rel_ci:
+                break
+    print('done' if cache is None else f'done ({n_cached} of {len(results)} from cache)')
+    if cache is not None:
+        cache.evict()
+
+    if rel_ci is not None:
+        print('Mean frustration {:.4g} +/- {:.2%} ({:.0%} CI) after {} simulations'.format(
+            stats.mean, stats.rel_half_width(confidence), confidence, stats.n))
+
+    frustrations = [result.avg_frustration for result in results]
+    controllers = [result.controller for result in results] if keep_controllers else []
+
+    output = {
+        'frustrations': frustrations,
+        'results': results,
+        'controllers': controllers,
+        'precision': stats.summary(confidence),
+    }
+    if profile:
+        output['profile'] = PhaseProfiler.merge(result.profile for result in results)
+        print(output['profile'].report())
+    return output
 
 
 if __name__ == '__main__':
@@ -151,19 +479,32 @@ if __name__ == '__main__':
     sim_kwargs = config['shared']
     sim_kwargs['frustration_fn'] = FRUSTRATION_MAP[sim_kwargs['frustration_fn']]
     sim_kwargs['lanes_config'] = [
-        {'traffic_rate_fn': partial(traffic_rate, **params)}
+        {'traffic_rate_fn': RateProfile(**params)}
         for params in sim_kwargs['lanes_config']
     ]
 
+    hist_dir = sim_kwargs.pop('hist_dir', None)
+
+    common_random_numbers = sim_kwargs.pop('common_random_numbers', False)
+    if common_random_numbers and sim_kwargs.get('seed') is None:
+        sim_kwargs['seed'] = np.random.SeedSequence().entropy
+        print(f'Common random numbers seed: {sim_kwargs["seed"]}')
+
     model_outputs = {}
     for model_name, model_kwargs in config['models'].items():
         model_kwargs['controller'] = globals()[model_kwargs['controller']]
+        if hist_dir is not None:
+            model_kwargs['hist_dir'] = Path(hist_dir) / model_name
         model_outputs[model_name] = main(**model_kwargs, **sim_kwargs)
 
     if config.get('n_sim', 1) > 20:
         plot_frustrations(model_outputs)
 
-    plot_hist_active(model_outputs, plot_total=False)
-    if 'snapshot_controller' in model_outputs:
-        plot_rate_estimate(model_outputs['snapshot_controller']['controllers'][0])
+    if common_random_numbers and sim_kwargs['n_sim'] > 1:
+        print_paired_differences(paired_differences(model_outputs))
+
+    if all(output['results'][0].has_hist for output in model_outputs.values()):
+        plot_hist_active(model_outputs, plot_total=False)
+    if 'snapshot_controller' in model_outputs and model_outputs['snapshot_controller']['results'][0].has_hist:
+        plot_rate_estimate(model_outputs['snapshot_controller']['results'][0])
     plt.show()
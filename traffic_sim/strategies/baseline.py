@@ -1,4 +1,5 @@
 from traffic_sim.entities.controller import Controller
+import numpy as np
 
 
 class ConstantController(Controller):
@@ -18,3 +19,18 @@ class ConstantController(Controller):
         """
         is_max_time_elapsed = self.clock.diff(self.active_lane.active_since) > self.wait_time
         return is_max_time_elapsed
+
+    def next_decision_time(self) -> float:
+        return self.first_tick_after(self.active_lane.active_since + self.wait_time)
+
+    @staticmethod
+    def is_time_up_batch(batch, wait_time: int, **kwargs) -> np.ndarray:
+        """
+        Vectorised counterpart of is_time_up, evaluated for every replicate of a BatchController.
+
+        Returns
+        -------
+        np.ndarray
+            Boolean array of shape (n_sim,), True where the maximum time has elapsed.
+        """
+        return batch.clock.diff(batch.active_lane_since) > wait_time
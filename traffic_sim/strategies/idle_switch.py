@@ -1,4 +1,5 @@
 from traffic_sim.entities.controller import Controller
+import numpy as np
 
 
 class IdleController(Controller):
@@ -27,3 +28,63 @@ class IdleController(Controller):
         is_idle_long = self.clock.diff(self.active_lane.last_exit_time) > self.idle_time
         is_max_time_elapsed = self.clock.diff(self.active_lane.active_since) > self.wait_time
         return is_lane_empty and is_idle_long or is_max_time_elapsed
+
+    @property
+    def is_rotating(self) -> bool:
+        """
+        True when every lane is empty and has been idle for longer than idle_time, so that the light moves on to
+        the next lane at every tick until a car arrives.
+        """
+        next_tick = self.clock.time + self.clock.step
+        is_idle_long = all(next_tick - lane.last_exit_time > self.idle_time for lane in self.lanes)
+        return self.num_active == 0 and is_idle_long
+
+    def next_decision_time(self) -> float:
+        """
+        Returns the earliest time at which is_time_up may return True. While rotating, the switches are applied by
+        skip_to instead, so no decision needs to be polled.
+        """
+        if self.is_rotating:
+            return np.inf
+
+        decision_time = self.first_tick_after(self.active_lane.active_since + self.wait_time)
+        if self.active_lane.num_active_cars == 0:
+            idle_time = self.first_tick_after(self.active_lane.last_exit_time + self.idle_time)
+            decision_time = min(decision_time, idle_time)
+        return decision_time
+
+    def skip_to(self, t: int) -> None:
+        """
+        Advances the clock to time t. While rotating, only the last n_lanes switches leave a trace on the lanes,
+        so the earlier ones are applied in a single step.
+        """
+        if t <= self.clock.time or not self.is_rotating:
+            return super().skip_to(t)
+
+        n_ticks = (t - self.clock.time) // self.clock.step
+        n_skipped = 0 if self.save_hist else max(0, n_ticks - self.n_lanes)
+
+        self.active_lane_num = (self.active_lane_num + n_skipped) % self.n_lanes
+        self.active_lane = self.lanes[self.active_lane_num]
+        self.clock.time += n_skipped * self.clock.step
+
+        for _ in range(n_ticks - n_skipped):
+            self.clock.tick()
+            self.run_next_lane()
+            if self.save_hist:
+                self.update_hist()
+
+    @staticmethod
+    def is_time_up_batch(batch, wait_time: int, idle_time: int, **kwargs) -> np.ndarray:
+        """
+        Vectorised counterpart of is_time_up, evaluated for every replicate of a BatchController.
+
+        Returns
+        -------
+        np.ndarray
+            Boolean array of shape (n_sim,), True where the conditions for lane switch are met.
+        """
+        is_lane_empty = batch.active_lane_num_cars == 0
+        is_idle_long = batch.clock.diff(batch.active_lane_last_exit_time) > idle_time
+        is_max_time_elapsed = batch.clock.diff(batch.active_lane_since) > wait_time
+        return is_lane_empty & is_idle_long | is_max_time_elapsed
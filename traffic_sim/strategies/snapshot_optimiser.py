@@ -4,12 +4,82 @@ import numpy as np
 from scipy.optimize import minimize
 
 
+def water_level(x: np.ndarray, total: float) -> float:
+    """
+    Finds the level mu at which sum(max(x - mu, 0)) equals total.
+
+    Parameters:
+    -----------
+    x: np.ndarray
+        The values being filled down to the level.
+    total: float
+        The positive amount lying above the level.
+
+    Returns:
+    --------
+    float
+        The level mu.
+    """
+    x_sorted = np.sort(x)[::-1]
+    excess = np.cumsum(x_sorted) - total
+    k = np.arange(1, len(x) + 1)
+    rho = np.nonzero(x_sorted - excess / k > 0)[0][-1]
+    return excess[rho] / (rho + 1)
+
+
+def water_filling_split(demand: np.ndarray) -> np.ndarray:
+    """
+    Exactly minimises sum(max(0, demand_i - t_i) ** 2) over the splits t with sum(t) = 1 and t >= 0.
+
+    If the lanes cannot all be cleared, the optimum gives green time only to the busiest lanes, leaving them all
+    with the same residual demand mu: t_i = max(0, demand_i - mu). Otherwise every split with t_i >= demand_i is
+    optimal, and the one closest to the uniform split is returned: t_i = max(demand_i, level).
+
+    Parameters:
+    -----------
+    demand: np.ndarray
+        The share of the loop each lane needs to clear its expected arrivals, i.e. entry rate / exit rate.
+
+    Returns:
+    --------
+    np.ndarray
+        The optimal proportion of the loop for each lane.
+    """
+    spare = 1 - demand.sum()
+    if spare <= 0:
+        return np.maximum(demand - water_level(demand, 1), 0)
+    return np.maximum(demand, -water_level(-demand, spare))
+
+
 class SnapshotController(Controller):
 
-    def __init__(self, rate_lookback: int = 300, loop_duration: int = 60, **kwargs):
+    def __init__(
+            self,
+            rate_lookback: int = 300,
+            loop_duration: int = 60,
+            rate_tolerance: float = 0,
+            **kwargs
+    ):
         super().__init__(**kwargs)
         self.rate_lookback = rate_lookback
         self.loop_duration = loop_duration
+        self.rate_tolerance = rate_tolerance
+
+        self._last_rates = None
+        self._last_split = None
+        # the loop under way when taken over from another controller keeps its split
+        is_mid_loop = self.clock.diff(self.active_lane.active_since) >= self.clock.step
+        self._loop_start = self.active_lane.active_since if is_mid_loop else None
+
+        for i, lane in enumerate(self.lanes):
+            lane.add_rate_window(self.rate_lookback)
+            if self.hist is not None:
+                self.hist.add_series(f'lane_{i}_wait_time', dtype=np.float64, run_length=True)
+
+            # lanes taken over mid-loop from another strategy keep a uniform split until the next loop starts
+            if not hasattr(lane, 'wait_time'):
+                lane.wait_time = int(self.loop_duration / self.n_lanes)
+                lane.entry_rate_estimate = self.estimate_entry_rate(lane)
 
     def queue_penalty(self, t: list[float]):
         """
@@ -43,12 +113,47 @@ class SnapshotController(Controller):
         float
             The estimated entry rate calculated based on the number of cars and the rate lookback time.
         """
-        n_cars = next((
-            i for i, car in enumerate(lane.active + lane.passed)
-            if self.clock.diff(car.arrival_time) > self.rate_lookback
-        ), len(lane.active) + len(lane.passed))
+        n_cars = lane.arrival_counter.count(self.rate_lookback)
         return n_cars / self.rate_lookback * 60
 
+    def optimal_split(self) -> np.ndarray:
+        """
+        Calculates the proportion of the loop given to each lane from the current entry rate estimates.
+
+        The split of the previous loop is reused when no estimate moved by more than rate_tolerance cars per minute.
+        The default queue_penalty is minimised exactly by water filling. Subclasses overriding queue_penalty fall
+        back to SLSQP, warm-started from the previous split.
+
+        Returns:
+        --------
+        np.ndarray
+            The proportion of the loop for each lane, summing to 1.
+        """
+        rates = np.array([lane.entry_rate_estimate for lane in self.lanes])
+        if self._last_split is not None and np.max(np.abs(rates - self._last_rates)) <= self.rate_tolerance:
+            return self._last_split
+
+        if type(self).queue_penalty is SnapshotController.queue_penalty:
+            with self.span('snapshot.water_filling'):
+                split = water_filling_split(rates / (self.exit_rate * 60))
+        else:
+            x0 = self._last_split if self._last_split is not None else np.array([1 / self.n_lanes] * self.n_lanes)
+            bounds = [(0, 1) for _ in range(self.n_lanes)]
+            cons = {'type': 'eq', 'fun': lambda x: sum(x) - 1}
+
+            with self.span('snapshot.minimize'):
+                res = minimize(
+                    self.queue_penalty,
+                    x0=x0,
+                    bounds=bounds,
+                    constraints=cons,
+                )
+            split = res.x
+
+        self._last_rates = rates
+        self._last_split = split
+        return split
+
     def is_time_up(self) -> bool:
         """
         Checks if the maximum time has elapsed for the current active lane based on
@@ -65,35 +170,32 @@ class SnapshotController(Controller):
             True if the maximum time has elapsed for the active lane, False otherwise.
         """
         is_first_lane = self.active_lane_num == 0
-        is_loop_start = self.clock.diff(self.active_lane.active_since) == 1
+        # the first decision since the first lane turned green, which coarse steps may take after its first tick
+        is_loop_start = self._loop_start != self.active_lane.active_since
 
         if is_first_lane and is_loop_start:
-            for lane in self.lanes:
-                lane.entry_rate_estimate = self.estimate_entry_rate(lane)
-
-            x0 = np.array([1 / self.n_lanes] * self.n_lanes)
-            bounds = [(0, 1) for _ in range(self.n_lanes)]
-            cons = {'type': 'eq', 'fun': lambda x: sum(x) - 1}
+            self._loop_start = self.active_lane.active_since
+            with self.span('snapshot.estimate_rates'):
+                for lane in self.lanes:
+                    lane.entry_rate_estimate = self.estimate_entry_rate(lane)
 
-            res = minimize(
-                self.queue_penalty,
-                x0=x0,
-                bounds=bounds,
-                constraints=cons,
-            )
-
-            for wait_time, lane in zip(res.x, self.lanes):
+            for wait_time, lane in zip(self.optimal_split(), self.lanes):
                 lane.wait_time = int(wait_time * self.loop_duration)
 
-        if self.save_hist:
-            for i, lane in enumerate(self.lanes):
-                key = f'lane_{i}_wait_time'
-                val = lane.entry_rate_estimate
-                # TODO: use default dict
-                if key in self.state_hist:
-                    self.state_hist[key].append(val)
-                else:
-                    self.state_hist[key] = [val]
-
         is_max_time_elapsed = self.clock.diff(self.active_lane.active_since) > self.active_lane.wait_time
         return is_max_time_elapsed
+
+    def hist_values(self) -> dict:
+        values = super().hist_values()
+        for i, lane in enumerate(self.lanes):
+            values[f'lane_{i}_wait_time'] = lane.entry_rate_estimate
+        return values
+
+    def next_decision_time(self) -> float:
+        """
+        Returns the next loop start or lane switch.
+        """
+        active_since = self.active_lane.active_since
+        if self.active_lane_num == 0 and self.clock.time < active_since + 1:
+            return active_since + 1
+        return self.first_tick_after(active_since + self.active_lane.wait_time)
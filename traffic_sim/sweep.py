@@ -0,0 +1,241 @@
+from traffic_sim.strategies import *
+from typing import Callable
+from traffic_sim.simulator import sim, sim_pool
+from traffic_sim.cache import ResultCache, result_key
+from traffic_sim.utils import timer, FRUSTRATION_MAP, RateProfile
+import concurrent.futures
+import csv
+import inspect
+import itertools
+import math
+from pathlib import Path
+import yaml
+import numpy as np
+
+
+def grid_values(spec) -> list:
+    """
+    Expands the grid specification of a single controller keyword argument.
+
+    Parameters
+    ----------
+    spec : list | dict | Any
+        Either a list of values, a range given as a dict with start, stop and step (stop included), or a single
+        fixed value.
+
+    Returns
+    -------
+    list
+        The values to sweep over.
+    """
+    if isinstance(spec, dict):
+        values = np.arange(spec['start'], spec['stop'] + spec['step'] / 2, spec['step'])
+        if all(isinstance(spec[k], int) for k in ('start', 'stop', 'step')):
+            return [int(v) for v in values]
+        return [float(v) for v in values]
+    if isinstance(spec, list):
+        return spec
+    return [spec]
+
+
+def expand_grid(grid: dict) -> list[dict]:
+    """
+    Returns every combination of the controller keyword arguments in grid.
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid_values(grid[n]) for n in names))]
+
+
+def accepted_kwargs(controller: Callable, kwargs: dict) -> dict:
+    """
+    Returns the entries of kwargs which sim or the controller accept, dropping the keys of the shared configuration
+    which only simulator.main uses, so that new configuration keys cannot break the sweep.
+    """
+    names = set()
+    for fn in (sim, controller.__init__):
+        names.update(
+            name for name, param in inspect.signature(fn).parameters.items()
+            if param.kind not in (param.VAR_POSITIONAL, param.VAR_KEYWORD)
+        )
+    return {key: value for key, value in kwargs.items() if key in names}
+
+
+@timer
+def successive_halving(
+        controller: Callable,
+        grid: dict,
+        n_sim: int,
+        min_sim: int = 4,
+        eta: int = 2,
+        seed: int = None,
+        verbose: bool = True,
+        cache_dir: str = None,
+        cache_max_mb: float = 1024,
+        **sim_kwargs
+) -> list[dict]:
+    """
+    Sweeps the controller over a grid of keyword arguments, spending replicates on the most promising settings.
+
+    Every configuration starts with min_sim replicates. After each rung only the best 1/eta configurations by
+    average frustration are kept, and their replicate count is multiplied by eta, up to n_sim. All (configuration,
+    replicate) jobs of a rung are scheduled on one shared process pool.
+
+    Parameters
+    ----------
+    controller : Callable
+        The controller class to sweep.
+    grid : dict
+        Mapping of controller keyword arguments to their grid specification, see grid_values.
+    n_sim : int
+        Number of replicates of the configurations reaching the last rung.
+    min_sim : int, optional
+        Number of replicates of every configuration in the first rung, by default 4.
+    eta : int, optional
+        Factor by which the number of configurations shrinks, and their replicates grow, every rung, by default 2.
+    seed : int, optional
+        Root seed of the sweep. Replicate k of every configuration uses the same child seed, so configurations are
+        compared on the same arrivals. Defaults to None (fresh entropy).
+    verbose : bool, optional
+        Whether to print the progress of every rung, by default True.
+    cache_dir : str, optional
+        Directory of the on-disk result cache shared with simulator.main. (configuration, replicate) jobs already
+        simulated by an earlier sweep or rung are read from it. Only used with a fixed seed, and without profile or a
+        checkpoint. Defaults to None (no cache).
+    cache_max_mb : float, optional
+        Size bound of the cache in MB, beyond which the least recently used results are evicted. Defaults to 1024.
+    **sim_kwargs
+        Keyword arguments passed to sim, shared by every configuration.
+
+    Returns
+    -------
+    list[dict]
+        One row per configuration, ranked from best to worst. Configurations which survived more rungs rank first.
+    """
+    configs = expand_grid(grid)
+    seeds = np.random.SeedSequence(seed).spawn(n_sim)
+    frustrations = [[] for _ in configs]
+    eliminated_at = [None] * len(configs)
+
+    use_cache = cache_dir is not None and seed is not None and not (
+        sim_kwargs.get('profile') or sim_kwargs.get('checkpoint') is not None
+    )
+    cache = ResultCache(cache_dir, max_bytes=int(cache_max_mb * 2 ** 20)) if use_cache else None
+
+    alive = list(range(len(configs)))
+    target = min(min_sim, n_sim)
+    rung = 0
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        while True:
+            jobs = [
+                (i, {**sim_kwargs, **configs[i], 'controller': controller, 'seed': seeds[k]})
+                for i in alive
+                for k in range(len(frustrations[i]), target)
+            ]
+            results = [None] * len(jobs)
+            if cache is not None:
+                keys = [result_key(job) for _, job in jobs]
+                results = [cache.get(key) for key in keys]
+
+            missing = [j for j, result in enumerate(results) if result is None]
+            if verbose:
+                print(f'Rung {rung}: {len(alive)} configurations x {target} replicates ({len(jobs)} jobs, '
+                      f'{len(jobs) - len(missing)} from cache)')
+
+            simulated = executor.map(sim_pool, [jobs[j][1] for j in missing], chunksize=max(1, len(missing) // 64))
+            for j, result in zip(missing, simulated):
+                results[j] = result
+                if cache is not None:
+                    cache.put(keys[j], result)
+
+            for (i, _), result in zip(jobs, results):
+                frustrations[i].append(result.avg_frustration)
+
+            if target >= n_sim or len(alive) == 1:
+                break
+
+            alive.sort(key=lambda i: np.mean(frustrations[i]))
+            n_keep = max(1, math.ceil(len(alive) / eta))
+            for i in alive[n_keep:]:
+                eliminated_at[i] = rung
+            alive = alive[:n_keep]
+            target = min(target * eta, n_sim)
+            rung += 1
+
+    if cache is not None:
+        cache.evict()
+
+    rows = []
+    for i, config in enumerate(configs):
+        values = np.array(frustrations[i])
+        std = float(values.std(ddof=1)) if len(values) > 1 else np.nan
+        rows.append({
+            **config,
+            'n_sim': len(values),
+            'mean_frustration': float(values.mean()),
+            'std_frustration': std,
+            'sem_frustration': std / math.sqrt(len(values)),
+            'eliminated_at_rung': eliminated_at[i],
+        })
+
+    rows.sort(key=lambda row: (-row['n_sim'], row['mean_frustration']))
+    for rank, row in enumerate(rows, start=1):
+        row['rank'] = rank
+    return rows
+
+
+def write_table(rows: list[dict], path: str | Path) -> None:
+    """
+    Writes the ranked rows of a sweep to a csv file.
+    """
+    fieldnames = ['rank'] + [key for key in rows[0] if key != 'rank']
+    with Path(path).open('w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_table(rows: list[dict], top: int = 10) -> None:
+    """
+    Prints the best top rows of a sweep.
+    """
+    fieldnames = ['rank'] + [key for key in rows[0] if key != 'rank']
+    print(' | '.join(f'{name:>12}' for name in fieldnames))
+    for row in rows[:top]:
+        print(' | '.join(f'{row[name]:>12.4g}' if isinstance(row[name], float) else f'{str(row[name]):>12}'
+                         for name in fieldnames))
+
+
+if __name__ == '__main__':
+
+    p = Path(__file__).with_name('config.yaml')
+    with p.open('r') as f:
+        config = yaml.safe_load(f)['simulation']
+
+    sim_kwargs = config['shared']
+    sim_kwargs['frustration_fn'] = FRUSTRATION_MAP[sim_kwargs['frustration_fn']]
+    sim_kwargs['lanes_config'] = [
+        {'traffic_rate_fn': RateProfile(**params)}
+        for params in sim_kwargs['lanes_config']
+    ]
+
+    sweep_config = config['sweep']
+    output = sweep_config.pop('output', 'sweep_results.csv')
+    sweep_config['controller'] = globals()[sweep_config['controller']]
+
+    if sim_kwargs.get('rel_ci') is not None:
+        raise ValueError(
+            'rel_ci is not supported by the sweep, whose replicate counts are set by n_sim, min_sim and eta. '
+            'Set rel_ci to null to run it.'
+        )
+
+    sweep_config.setdefault('cache_dir', sim_kwargs.pop('cache_dir', None))
+
+    # the sweep seeds its own replicates and never keeps their history
+    for key in ('save_hist', 'seed'):
+        sim_kwargs.pop(key, None)
+    sim_kwargs = accepted_kwargs(sweep_config['controller'], sim_kwargs)
+
+    ranked = successive_halving(**sweep_config, **sim_kwargs)
+    write_table(ranked, output)
+    print_table(ranked)
+    print(f'Ranked results written to {output}')
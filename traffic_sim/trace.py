@@ -0,0 +1,263 @@
+"""
+Recorded arrival traces.
+
+A trace of loop-detector timestamps is converted once into a directory holding one sorted array of uint32 arrival
+seconds per lane, as .npy files, and a meta.json:
+
+    python -m traffic_sim.trace detections.csv trace_dir --lane-column detector --time-column timestamp
+
+The arrays are memory-mapped by TraceArrivals, which replays a lane of the trace through Lane's arrivals parameter.
+Different windows of the same trace can be replayed by different pool workers, each only reading its own window.
+"""
+from traffic_sim.entities.arrivals import TraceArrivals
+from traffic_sim.simulator import sim_pool
+from traffic_sim.utils import FRUSTRATION_MAP, timer
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+import argparse
+import concurrent.futures
+import csv
+import json
+import math
+import numpy as np
+
+
+TRACE_VERSION = 1
+
+
+def write_trace(
+        path: str | Path,
+        lane_times: list[np.ndarray],
+        origin: float = None,
+        lane_names: list[str] = None,
+) -> dict:
+    """
+    Writes the arrival timestamps of every lane as a trace directory.
+
+    Parameters
+    ----------
+    path : str | Path
+        The trace directory. It is created if missing.
+    lane_times : list[np.ndarray]
+        The arrival timestamps in seconds of every lane, in any order.
+    origin : float, optional
+        The timestamp of second 0 of the trace, by default the earliest arrival rounded down.
+    lane_names : list[str], optional
+        The names of the lanes, e.g. their detector ids, by default their indices.
+
+    Returns
+    -------
+    dict
+        The metadata of the trace.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    lane_times = [np.asarray(times, dtype=float) for times in lane_times]
+    if origin is None:
+        origin = math.floor(min((times.min() for times in lane_times if len(times)), default=0.))
+
+    n_cars = []
+    duration = 0
+    for lane, times in enumerate(lane_times):
+        seconds = np.floor(times - origin)
+        if len(seconds) and (seconds.min() < 0 or seconds.max() >= 2 ** 32):
+            raise ValueError(f'Arrivals of lane {lane} fall outside the 136 years after the origin.')
+        seconds = np.sort(seconds).astype(np.uint32)
+        np.save(path / f'lane_{lane}.npy', seconds)
+        n_cars.append(len(seconds))
+        duration = max(duration, int(seconds[-1]) + 1 if len(seconds) else 0)
+
+    meta = {
+        'version': TRACE_VERSION,
+        'n_lanes': len(lane_times),
+        'origin': origin,
+        'duration': duration,
+        'n_cars': n_cars,
+        'lane_names': [str(name) for name in (lane_names or range(len(lane_times)))],
+    }
+    (path / 'meta.json').write_text(json.dumps(meta, indent=2))
+    return meta
+
+
+def _parse_timestamp(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+@timer
+def convert_trace(
+        src: str | Path,
+        dst: str | Path,
+        lane_column: str = 'lane',
+        time_column: str = 'timestamp',
+        delimiter: str = ',',
+        origin: float = None,
+) -> dict:
+    """
+    Converts a CSV file of detections, one car per row, into a trace directory. The file is streamed, and only the
+    arrival times are kept in memory, at 8 bytes per car.
+
+    Parameters
+    ----------
+    src : str | Path
+        The CSV file, with a header row.
+    dst : str | Path
+        The trace directory to write.
+    lane_column : str, optional
+        The column identifying the lane, by default 'lane'. Lanes are numbered in the sorted order of its values.
+    time_column : str, optional
+        The column holding the arrival time, either in seconds or as an ISO 8601 date, by default 'timestamp'.
+    delimiter : str, optional
+        The CSV delimiter, by default ','.
+    origin : float, optional
+        The timestamp of second 0 of the trace, by default the earliest arrival rounded down.
+
+    Returns
+    -------
+    dict
+        The metadata of the trace.
+    """
+    lane_times = {}
+    with open(src, newline='') as f:
+        for row in csv.DictReader(f, delimiter=delimiter):
+            lane = row[lane_column]
+            if lane not in lane_times:
+                lane_times[lane] = array('d')
+            lane_times[lane].append(_parse_timestamp(row[time_column]))
+
+    names = sorted(lane_times, key=lambda name: (len(name), name) if name.isdigit() else (math.inf, name))
+    return write_trace(dst, [np.frombuffer(lane_times[name]) for name in names], origin, names)
+
+
+def load_trace_meta(path: str | Path) -> dict:
+    """
+    Returns the metadata of a trace directory.
+
+    Raises
+    ------
+    ValueError
+        If the trace was written by an incompatible version.
+    """
+    meta = json.loads((Path(path) / 'meta.json').read_text())
+    if meta.get('version') != TRACE_VERSION:
+        raise ValueError(f'Trace {path} has version {meta.get("version")}, but version {TRACE_VERSION} is expected.')
+    return meta
+
+
+def trace_lanes_config(path: str | Path, start: int = 0) -> list[dict]:
+    """
+    Returns the lanes_config replaying every lane of a trace from its second start. The recorded rate of every lane
+    serves as its traffic_rate_fn.
+    """
+    lanes_config = []
+    for lane in range(load_trace_meta(path)['n_lanes']):
+        arrivals = TraceArrivals(path, lane, start)
+        lanes_config.append({'traffic_rate_fn': arrivals.rate, 'arrivals': arrivals})
+    return lanes_config
+
+
+def trace_windows(path: str | Path, window_hours: float, n_windows: int = None) -> list[int]:
+    """
+    Splits a trace into consecutive windows of window_hours, returning the start second of each of them.
+
+    Parameters
+    ----------
+    path : str | Path
+        The trace directory.
+    window_hours : float
+        The length of every window in hours.
+    n_windows : int, optional
+        The number of windows, by default as many as fit in the trace.
+
+    Returns
+    -------
+    list[int]
+        The start of every window, in seconds from the start of the trace.
+    """
+    window = math.ceil(window_hours * 60 * 60)
+    n_fit = load_trace_meta(path)['duration'] // window
+    if n_windows is None:
+        n_windows = n_fit
+    elif n_windows > n_fit:
+        raise ValueError(f'The trace only holds {n_fit} windows of {window_hours} hours.')
+    return [k * window for k in range(n_windows)]
+
+
+@timer
+def trace_main(
+        controller: Callable,
+        trace_path: str | Path,
+        window_hours: float = 24,
+        n_windows: int = None,
+        exit_rate: float = 0.5,
+        frustration_fn: Callable = FRUSTRATION_MAP['quad'],
+        **sim_kwargs
+) -> dict:
+    """
+    Evaluates a controller against a recorded trace, replaying every window of it in its own simulation over the
+    process pool. Workers receive the location of the trace and of their window, and map only what they replay.
+
+    Parameters
+    ----------
+    controller : Callable
+        The controller function to control the traffic flow.
+    trace_path : str | Path
+        The trace directory.
+    window_hours : float, optional
+        The length of every window in hours, by default 24.
+    n_windows : int, optional
+        The number of windows, by default as many as fit in the trace.
+    exit_rate : float, optional
+        The rate at which cars exit the system, by default 0.5.
+    frustration_fn : Callable, optional
+        Function to calculate the frustration of the system.
+    **sim_kwargs
+        Additional keyword arguments to be passed to sim.
+
+    Returns
+    -------
+    dict
+        The start of every window under 'windows', and the average frustration and SimulationResult of every window
+        under 'frustrations' and 'results'.
+    """
+    windows = trace_windows(trace_path, window_hours, n_windows)
+    jobs = [
+        {
+            **sim_kwargs,
+            'controller': controller,
+            'lanes_config': trace_lanes_config(trace_path, start),
+            'exit_rate': exit_rate,
+            'frustration_fn': frustration_fn,
+            'duration_hours': window_hours,
+        }
+        for start in windows
+    ]
+
+    print(f'Replaying trace ({controller.__name__}, {len(windows)} windows)...', end='')
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        results = list(executor.map(sim_pool, jobs))
+    print('done')
+
+    return {
+        'windows': windows,
+        'frustrations': [result.avg_frustration for result in results],
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Convert a CSV file of detections into a trace directory.')
+    parser.add_argument('src', help='The CSV file, with a header row.')
+    parser.add_argument('dst', help='The trace directory to write.')
+    parser.add_argument('--lane-column', default='lane')
+    parser.add_argument('--time-column', default='timestamp')
+    parser.add_argument('--delimiter', default=',')
+    args = parser.parse_args()
+
+    meta = convert_trace(args.src, args.dst, args.lane_column, args.time_column, args.delimiter)
+    print(f'Wrote {sum(meta["n_cars"]):,} cars over {meta["duration"] / 60 / 60:,.1f} hours in {meta["n_lanes"]} lanes.')
@@ -1,8 +1,12 @@
-from typing import Self, Any, Callable
-from functools import wraps, cache
+from typing import Self, Any, Callable, Iterable
+from functools import wraps, cache, lru_cache
+from contextlib import contextmanager
 import time
 import numpy as np
-from scipy.stats import beta
+from scipy.stats import beta, t as student_t
+
+
+SECONDS_PER_DAY = 24 * 60 * 60
 
 
 class Clock:
@@ -45,6 +49,63 @@ class Clock:
         return self.time - t
 
 
+class RunningStats:
+    """
+    Class keeping the running mean and variance of a stream of values with Welford's algorithm.
+
+    Attributes
+    ----------
+    n : int
+        Number of values seen so far.
+    mean : float
+        Mean of the values seen so far.
+
+    Methods
+    -------
+    update(x) -> Self
+        Adds a value to the stream.
+    half_width(confidence) -> float
+        Half-width of the t confidence interval of the mean.
+    rel_half_width(confidence) -> float
+        Half-width of the confidence interval relative to the absolute mean.
+    summary(confidence) -> dict
+        The number of values, mean and confidence interval half-widths.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / (self.n - 1) if self.n > 1 else np.nan
+
+    def update(self, x: float) -> Self:
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (x - self.mean)
+        return self
+
+    def half_width(self, confidence: float = 0.95) -> float:
+        if self.n < 2:
+            return np.inf
+        return student_t.ppf((1 + confidence) / 2, self.n - 1) * np.sqrt(self.variance / self.n)
+
+    def rel_half_width(self, confidence: float = 0.95) -> float:
+        return self.half_width(confidence) / abs(self.mean) if self.mean != 0 else np.inf
+
+    def summary(self, confidence: float = 0.95) -> dict:
+        return {
+            'n_sim': self.n,
+            'mean': self.mean,
+            'half_width': self.half_width(confidence),
+            'rel_half_width': self.rel_half_width(confidence),
+            'confidence': confidence,
+        }
+
+
 def print_padding(text: Any, pad_char: str = '*', string_len: int = 50) -> None:
     """
     A function to print text surrounded by padding characters to a specified string length.
@@ -94,15 +155,91 @@ def timer(func: Callable) -> Callable:
     return wrapper
 
 
+class PhaseProfiler:
+    """
+    Class accumulating the wall-clock time and number of calls of named phases of a simulation.
+
+    Attributes
+    ----------
+    seconds : dict[str, float]
+        Total wall-clock time spent in every phase.
+    calls : dict[str, int]
+        Number of times every phase ran.
+
+    Methods
+    -------
+    add(name, seconds, calls) -> None
+        Adds time spent in a phase.
+    span(name) -> ContextManager
+        Times the enclosed block as a phase.
+    merge(profilers) -> PhaseProfiler
+        Sums several profilers, e.g. those of every pool worker.
+    report() -> str
+        A table of the phases, by decreasing total time.
+
+    Notes
+    -----
+    Spans may be nested, e.g. a strategy's solver inside is_time_up, so the total times of all phases can add up
+    to more than the wall-clock time of the run.
+    """
+
+    def __init__(self):
+        self.seconds: dict[str, float] = {}
+        self.calls: dict[str, int] = {}
+
+    def add(self, name: str, seconds: float, calls: int = 1) -> None:
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    @contextmanager
+    def span(self, name: str):
+        tick = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - tick)
+
+    @classmethod
+    def merge(cls, profilers: Iterable['PhaseProfiler']) -> 'PhaseProfiler':
+        merged = cls()
+        for profiler in profilers:
+            for name, seconds in profiler.seconds.items():
+                merged.add(name, seconds, profiler.calls[name])
+        return merged
+
+    def report(self) -> str:
+        lines = [f'{"phase":<28} {"total (s)":>10} {"calls":>12} {"per call (us)":>14}']
+        for name, seconds in sorted(self.seconds.items(), key=lambda item: -item[1]):
+            calls = self.calls[name]
+            lines.append(f'{name:<28} {seconds:>10.3f} {calls:>12,} {seconds / calls * 1e6:>14.2f}')
+        return '\n'.join(lines)
+
+
 def quadratic_frustration_fn(x) -> float:
     return (x / 60) ** 2
 
 
+# polynomial coefficients in the waiting time (in seconds), lowest order first.
+# Lane uses these to keep the frustration of waiting cars up to date in constant time.
+quadratic_frustration_fn.poly_coefs = (0, 0, 1 / 60 ** 2)
+
+
 def expon_frustration_fn(x, k: float = 1) -> float:
     return np.exp(k * (x / 60)) - 1
 
 
 @cache
+def _beta_peak(peak_time: float) -> tuple[float, float, float]:
+    """
+    Returns the beta parameters (a, b) whose mode lies at peak_time hours into the day, and the density at that mode.
+    """
+    r = peak_time / 24
+    b = 10
+    a = - ((b - 2) * r + 1) / (r - 1)
+    mode = beta.pdf((a - 1) / (a + b - 2), a, b)
+    return a, b, mode
+
+
 def traffic_rate(
         t_hours: float,
         morning_peak_time: float = 8,
@@ -116,8 +253,8 @@ def traffic_rate(
 
     Parameters:
     ----------
-    t_hours: float
-        The time in hours.
+    t_hours: float or np.ndarray
+        The time in hours. Arrays are evaluated elementwise.
     morning_peak_time: float, default 8
         The time of the morning peak.
     morning_peak_rate: float, default 50
@@ -137,16 +274,8 @@ def traffic_rate(
     t_hours = t_hours % 24
 
     t_beta = t_hours / 24
-    r = morning_peak_time / 24
-    b_morning = 10
-    a_morning = - ((b_morning - 2) * r + 1) / (r - 1)
-
-    r = evening_peak_time / 24
-    b_evening = 10
-    a_evening = - ((b_evening - 2) * r + 1) / (r - 1)
-
-    mode_morning = beta.pdf((a_morning - 1) / (a_morning + b_morning - 2), a_morning, b_morning)
-    mode_evening = beta.pdf((a_evening - 1) / (a_evening + b_evening - 2), a_evening, b_evening)
+    a_morning, b_morning, mode_morning = _beta_peak(morning_peak_time)
+    a_evening, b_evening, mode_evening = _beta_peak(evening_peak_time)
 
     morning_rate = beta.pdf(t_beta, a_morning, b_morning) / mode_morning * (morning_peak_rate - baseline_night_rate)
     evening_rate = beta.pdf(t_beta, a_evening, b_evening) / mode_evening * (evening_peak_rate - baseline_night_rate)
@@ -154,6 +283,75 @@ def traffic_rate(
     return baseline_night_rate + morning_rate + evening_rate
 
 
+@lru_cache(maxsize=64)
+def _rate_table(resolution: int, rate_params: tuple[tuple[str, float], ...]) -> np.ndarray:
+    t_hours = np.arange(0, SECONDS_PER_DAY, resolution) / 60 / 60
+    rates = np.asarray(traffic_rate(t_hours, **dict(rate_params)), dtype=np.float64)
+    rates.flags.writeable = False
+    return rates
+
+
+class RateProfile:
+    """
+    Class holding the daily traffic rate of a lane, evaluated once at the clock resolution.
+
+    Parameters
+    ----------
+    resolution : int
+        Number of seconds between two tabulated rates, by default 1 (the Clock step).
+    **rate_params
+        Keyword arguments of traffic_rate, such as morning_peak_rate and evening_peak_rate.
+
+    Attributes
+    ----------
+    rates : np.ndarray
+        Read-only rates (cars per minute) covering a full 24-hour day.
+
+    Methods
+    -------
+    __call__(t_hours) -> float
+        Looks up the rate at a time given in hours, a drop-in replacement for partial(traffic_rate, ...).
+    rate_at(t_seconds) -> float
+        Looks up the rate at a time given in seconds.
+    rates_between(start, stop) -> np.ndarray
+        Rates for every second in [start, stop).
+
+    Notes
+    -----
+    Since the rate is periodic over a day, lookups wrap around so that multi-day runs reuse the same table.
+    Tables are shared between profiles with equal parameters, and only the parameters are pickled, so profiles
+    are cheap to send to pool workers.
+    """
+
+    def __init__(self, resolution: int = 1, **rate_params):
+        self.resolution = resolution
+        self.rate_params = rate_params
+        self.rates = _rate_table(resolution, tuple(sorted(rate_params.items())))
+
+    def __getstate__(self) -> dict:
+        return {'resolution': self.resolution, 'rate_params': self.rate_params}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state['resolution'], **state['rate_params'])
+
+    def __repr__(self) -> str:
+        params = ', '.join(f'{k}={v}' for k, v in self.rate_params.items())
+        return f'RateProfile({params})'
+
+    def __call__(self, t_hours: float | np.ndarray) -> float | np.ndarray:
+        if isinstance(t_hours, np.ndarray):
+            idx = np.round(t_hours * 60 * 60 / self.resolution).astype(np.int64)
+            return self.rates[idx % len(self.rates)]
+        return self.rate_at(t_hours * 60 * 60)
+
+    def rate_at(self, t_seconds: float) -> float:
+        return self.rates[int(round(t_seconds / self.resolution)) % len(self.rates)]
+
+    def rates_between(self, start: int, stop: int) -> np.ndarray:
+        idx = np.arange(start, stop) // self.resolution
+        return self.rates.take(idx, mode='wrap')
+
+
 FRUSTRATION_MAP = {
     'quad': quadratic_frustration_fn,
     'expon': expon_frustration_fn